@@ -17,7 +17,9 @@ __version__ = '0.0.5'
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend as DjangoModelBackend
+from django.contrib.contenttypes.models import ContentType
 
+from .cache import ObjectPermissionCache, PermissionUidCache, UserPermissionCache
 from .models import *
 
 class ModelBackend(DjangoModelBackend):
@@ -31,11 +33,42 @@ class ModelBackend(DjangoModelBackend):
     generic permission over all instances, so if the user has a permission on a
     model class, this means he has a permission over all its instances.    
     """
+    def _get_permissions(self, user_obj, obj, from_name):
+        """Returns the model-level perms of user_obj, resolving UIDs in memory.
+
+        Unlike Django's implementation, it doesn't join the ContentType table:
+        permission UIDs are resolved using the PermissionUidCache.
+        """
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+
+        perm_cache_name = '_%s_perm_cache' % from_name
+        if not hasattr(user_obj, perm_cache_name):
+            if user_obj.is_superuser:
+                perms = Permission.objects.all()
+            else:
+                perms = getattr(self, '_get_%s_permissions' % from_name)(user_obj)
+            perm_ids = list(perms.values_list('pk', flat=True).order_by())
+            setattr(user_obj, perm_cache_name, set([uid for uid in PermissionUidCache().get_uids(perm_ids) if uid]))
+        return getattr(user_obj, perm_cache_name)
+
     def get_group_permissions(self, user_obj, obj=None):
         return super(ModelBackend, self).get_group_permissions(user_obj)
         
     def get_all_permissions(self, user_obj, obj=None):
-        return super(ModelBackend, self).get_all_permissions(user_obj)
+        """Returns all the model-level perms of user_obj.
+
+        Perms are shared across requests through the UserPermissionCache.
+        """
+        if not user_obj.is_active or user_obj.is_anonymous:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            perms = UserPermissionCache().get(user_obj, "perms")
+            if perms is None:
+                perms = super(ModelBackend, self).get_all_permissions(user_obj)
+                UserPermissionCache().set(user_obj, "perms", perms)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
 
     def has_perm(self, user_obj, perm, obj=None):
         if isinstance(perm, Permission):
@@ -59,31 +92,82 @@ class ObjectPermissionBackend(object):
         # This backend doesn't handle user authentication.
         return None
 
+    def _get_cache_key(self, obj=None):
+        """Returns the key used to cache the object perms related to obj.
+        """
+        if obj is None:
+            return None
+        ct = ContentType.objects.get_for_model(obj.__class__)
+        return (ct.pk, obj.pk)
+
+    def _get_perm_cache(self, user_obj, cache_name):
+        """Returns the per-request cache of user_obj identified by cache_name.
+
+        Caches live on the user_obj itself (as Django's ModelBackend does), so
+        they last for a single request. They are also discarded as soon as any
+        object permission is granted or revoked. Cross-request caching is left
+        to the UserPermissionCache (see get_all_permissions).
+        """
+        generation = ObjectPermissionCache().generation
+        if getattr(user_obj, '_obj_perm_cache_generation', None) != generation:
+            user_obj._user_obj_perm_cache = {}
+            user_obj._group_obj_perm_cache = {}
+            user_obj._obj_perm_cache = {}
+            user_obj._obj_perm_cache_generation = generation
+        if not hasattr(user_obj, cache_name):
+            setattr(user_obj, cache_name, {})
+        return getattr(user_obj, cache_name)
+
+    def _get_obj_perm_uids(self, perms):
+        """Returns the UIDs of the given object perms (without any join).
+
+        Only (perm_id, object_id) pairs are fetched, without duplicates and
+        without instantiating any model: UIDs are resolved in memory.
+        """
+        perms = list(perms.values_list('perm_id', 'object_id').order_by().distinct())
+        perm_uids = PermissionUidCache().get_uids([perm_id for perm_id, obj_id in perms])
+        return set(["%s.%s" % (uid, obj_id) for uid, (perm_id, obj_id) in zip(perm_uids, perms) if uid])
+
     def get_user_permissions(self, user_obj, obj=None):
         """Returns all and only the object perms granted to the user_obj itself.
         """
-        if True: # not hasattr(user_obj, '_user_obj_perm_cache'):
-            user_obj._user_obj_perm_cache = set([p.uid for p in user_obj.objectpermissions.get_by_object(obj)])
-        return user_obj._user_obj_perm_cache
+        cache = self._get_perm_cache(user_obj, '_user_obj_perm_cache')
+        key = self._get_cache_key(obj)
+        if key not in cache:
+            cache[key] = self._get_obj_perm_uids(user_obj.objectpermissions.get_by_object(obj))
+        return cache[key]
 
     def get_group_permissions(self, user_obj, obj=None):
         """Returns all and only the object perms granted to the groups of the given user_obj.
         """
-        if True: # not hasattr(user_obj, '_group_obj_perm_cache'):
-            perms = ObjectPermission.objects.get_group_permissions(user_obj, obj)
-            perms = perms.values_list('perm__content_type__app_label', 'perm__codename', 'object_id').order_by()
-            user_obj._group_obj_perm_cache = set(["%s.%s.%s" % (ct, name, obj_id) for ct, name in perms])
-        return user_obj._group_obj_perm_cache
+        cache = self._get_perm_cache(user_obj, '_group_obj_perm_cache')
+        key = self._get_cache_key(obj)
+        if key not in cache:
+            cache[key] = self._get_obj_perm_uids(ObjectPermission.objects.get_group_permissions(user_obj, obj))
+        return cache[key]
 
     def get_all_permissions(self, user_obj, obj=None):
         """Returns all and only the object perms granted to the given user_obj.
+
+        Both user and group perms are loaded with a single query. Perms of a
+        given obj are shared across requests through the UserPermissionCache,
+        while the (unbounded) set of all the perms is never cached there.
         """
         if user_obj.is_anonymous:
             return set()
-        if True: # not hasattr(user_obj, '_obj_perm_cache'):
-            user_obj._obj_perm_cache = self.get_user_permissions(user_obj, obj)
-            user_obj._obj_perm_cache.update(self.get_group_permissions(user_obj, obj))
-        return user_obj._obj_perm_cache
+        cache = self._get_perm_cache(user_obj, '_obj_perm_cache')
+        key = self._get_cache_key(obj)
+        if key not in cache:
+            if key is None:
+                perms = self._get_obj_perm_uids(ObjectPermission.objects.get_all_permissions(user_obj, obj))
+            else:
+                name = "obj_perms.%s.%s" % key
+                perms = UserPermissionCache().get(user_obj, name)
+                if perms is None:
+                    perms = self._get_obj_perm_uids(ObjectPermission.objects.get_all_permissions(user_obj, obj))
+                    UserPermissionCache().set(user_obj, name, perms)
+            cache[key] = perms
+        return cache[key]
 
     def has_perm(self, user_obj, perm, obj=None):
         """This method checks if the user_obj has perm on obj.
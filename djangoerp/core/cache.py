@@ -15,7 +15,14 @@ __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
 
-from django.contrib.auth.models import AnonymousUser
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.template import Engine
+from django.template.loader import render_to_string
+from django.utils.translation import get_language
+from django.contrib.auth.models import AnonymousUser, Permission
 from .singleton import Singleton
 
 
@@ -46,3 +53,205 @@ class LoggedInUserCache(metaclass=Singleton):
     @property
     def has_user(self):
         return self.user and self.user.is_authenticated
+
+
+class TemplateFragmentCache(metaclass=Singleton):
+    """Process-wide cache of constant template fragments (i.e. "elements/yes.html").
+
+    Each fragment is rendered (without context) once per theme and language,
+    then it's served from memory. The whole cache is cleared as soon as the
+    templates are reloaded or the template settings change.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._fragments = {}
+
+    def get(self, template_name):
+        """Returns the stripped rendering of template_name.
+        """
+        key = (template_name, getattr(settings, 'THEME_PATH', None), get_language())
+        try:
+            return self._fragments[key]
+        except KeyError:
+            fragment = render_to_string(template_name, {}).strip()
+            self._fragments[key] = fragment
+            return fragment
+
+
+class TemplateCache(metaclass=Singleton):
+    """Process-wide cache of the compiled templates used by rendering tags.
+
+    Each template is loaded (and parsed) by the default engine once per
+    theme, even without the cached template loader (i.e. in DEBUG mode). The
+    whole cache is cleared as soon as the templates are reloaded or the
+    template settings change.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._templates = {}
+
+    def get(self, template_name):
+        """Returns the compiled template identified by template_name.
+        """
+        key = (template_name, getattr(settings, 'THEME_PATH', None))
+        try:
+            return self._templates[key]
+        except KeyError:
+            html_template = Engine.get_default().get_template(template_name)
+            self._templates[key] = html_template
+            return html_template
+
+
+class ObjectPermissionCache(metaclass=Singleton):
+    """Keeps track of changes to row/object-level permissions.
+
+    Every time an object permission is granted or revoked (to a user or to one
+    of his groups) the current generation is increased. Per-request permission
+    caches built during a previous generation are stale and must be discarded.
+    """
+
+    generation = 0
+
+    def invalidate(self):
+        self.generation += 1
+
+
+class PermissionUidCache(metaclass=Singleton):
+    """Process-wide map between Permission UIDs and primary keys.
+
+    A permission UID is a string in the form "app_label.codename". The whole
+    map is loaded lazily with a single query and it's reloaded as soon as a
+    Permission (or a ContentType) is added, changed or deleted.
+
+    Unknown UIDs and primary keys (i.e. added by another process) cause the
+    map to be reloaded only once: if they are still unknown, they are
+    remembered as missing until the map is cleared again.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._uids = None
+        self._pks = None
+        self._missing = set()
+
+    def load(self):
+        uids = {}
+        pks = {}
+        for pk, app_label, codename in Permission.objects.values_list('pk', 'content_type__app_label', 'codename').order_by():
+            uid = "%s.%s" % (app_label, codename)
+            uids[pk] = uid
+            pks[uid] = pk
+        self._uids, self._pks = uids, pks
+
+    def _lookup(self, mapping, keys):
+        if self._uids is None:
+            self.load()
+        elif any(k not in getattr(self, mapping) and k not in self._missing for k in keys):
+            self.load()
+        values = getattr(self, mapping)
+        self._missing.update(k for k in keys if k not in values)
+        return [values.get(k, None) for k in keys]
+
+    def get_uid(self, pk):
+        """Returns the UID of the permission identified by pk (or None).
+        """
+        return self.get_uids([pk])[0]
+
+    def get_uids(self, pks):
+        """Returns the list of UIDs of the permissions identified by pks.
+
+        The map is reloaded (at most once) if any of pks is unknown.
+        """
+        return self._lookup('_uids', pks)
+
+    def get_pk(self, uid):
+        """Returns the primary key of the permission identified by uid (or None).
+        """
+        return self._lookup('_pks', [uid])[0]
+
+
+class UserPermissionCache(metaclass=Singleton):
+    """Cross-request cache of the permissions granted to each user.
+
+    Permission sets are stored using Django's cache framework (the cache
+    identified by PERMISSION_CACHE_ALIAS setting) under the current generation
+    of their user. Every time a user's permissions change, its generation is
+    renewed and all its previously cached sets become unreachable. A global
+    generation is also available to invalidate the sets of all users at once.
+
+    Generations are renewed both immediately and when the current transaction
+    is committed, while sets are stored only on commit: this way a rolled back
+    transaction can't leave stale (or uncommitted) permissions in the cache.
+
+    It's disabled by default: the cache must be shared by all the worker
+    processes, otherwise invalidations don't reach the other workers.
+    """
+
+    key_prefix = "djangoerp.perms"
+
+    @property
+    def cache(self):
+        alias = getattr(settings, 'PERMISSION_CACHE_ALIAS', None)
+        if alias:
+            return caches[alias]
+        return None
+
+    def _get_generation_key(self, user_pk=None):
+        if user_pk is None:
+            return "%s.gen" % self.key_prefix
+        return "%s.gen.%s" % (self.key_prefix, user_pk)
+
+    def _get_key(self, user_obj, name):
+        cache = self.cache
+        global_key = self._get_generation_key()
+        user_key = self._get_generation_key(user_obj.pk)
+        generations = cache.get_many([global_key, user_key])
+        for key in (global_key, user_key):
+            if key not in generations:
+                cache.add(key, uuid4().hex, None)
+                generations[key] = cache.get(key)
+        return "%s.%s.%s.%s.%s" % (self.key_prefix, name, user_obj.pk, generations[global_key], generations[user_key])
+
+    def get(self, user_obj, name):
+        """Returns the cached set called name for user_obj (or None).
+        """
+        if self.cache is None or not user_obj.pk:
+            return None
+        return self.cache.get(self._get_key(user_obj, name))
+
+    def set(self, user_obj, name, value):
+        """Stores value as the set called name for user_obj.
+        """
+        cache = self.cache
+        if cache is None or not user_obj.pk:
+            return
+        key = self._get_key(user_obj, name)
+        timeout = getattr(settings, 'PERMISSION_CACHE_TIMEOUT', None)
+        transaction.on_commit(lambda: cache.set(key, value, timeout))
+
+    def _renew(self, keys):
+        cache = self.cache
+        if cache is None or not keys:
+            return
+        def renew():
+            cache.set_many(dict([(k, uuid4().hex) for k in keys]), None)
+        renew()
+        transaction.on_commit(renew)
+
+    def invalidate(self, user_pks):
+        """Discards the cached sets of the given users.
+        """
+        self._renew([self._get_generation_key(pk) for pk in user_pks if pk is not None])
+
+    def invalidate_all(self):
+        """Discards the cached sets of all users.
+        """
+        self._renew([self._get_generation_key()])
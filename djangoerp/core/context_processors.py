@@ -14,42 +14,86 @@ __author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
 __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
-from django.utils.functional import lazy
+from django.utils.functional import SimpleLazyObject
 
+from .cache import ObjectPermissionCache, PermissionUidCache
 from .models import *
 
 # ObjPermWrapper and ObjPermLookupDict proxy the permissions system into objects
 # the template system could understand.
 
+class AllObjects(object):
+    """A sentinel which contains every object (returned for superusers).
+    """
+    def __contains__(self, item):
+        return True
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        return isinstance(other, AllObjects)
+
+    def __repr__(self):
+        return "<all objects>"
+
+ALL_OBJECTS = AllObjects()
+
 class ObjPermLookupDict(object):
-    def __init__(self, user, module_name):
+    def __init__(self, user, module_name, perms=None):
         self.user = user
         self.module_name = module_name
+        self.perms = perms or []
 
     def __repr__(self):
         if self.user.is_superuser:
-            return repr([p.uid for p in ObjectPermission.objects.filter(perm__content_type__app_label=self.module_name) if len(p.uid.split('.')) == 3])
-        return repr([p.uid for p in self.user.objectpermissions.filter(perm__content_type__app_label=self.module_name) if len(p.uid.split('.')) == 3])
+            perms = list(ObjectPermission.objects.filter(perm__content_type__app_label=self.module_name).values_list('perm_id', 'object_id').order_by('perm_id', 'object_id'))
+            uids = PermissionUidCache().get_uids([perm_id for perm_id, object_id in perms])
+            return repr(["%s.%s" % (uid, object_id) for uid, (perm_id, object_id) in zip(uids, perms)])
+        return repr(["%s.%s.%s" % (self.module_name, codename, object_id) for codename, object_id in self.perms])
 
     def __getitem__(self, perm_name):
         if self.user.is_superuser:
-            perms = Permission.objects.filter(content_type__app_label=self.module_name, codename=perm_name)
-            return [obj.pk for p in perms for obj in p.content_type.model_class().objects.all()]
-        return [p.object_id for p in self.user.objectpermissions.filter(perm__content_type__app_label=self.module_name, perm__codename=perm_name)]
+            if PermissionUidCache().get_pk("%s.%s" % (self.module_name, perm_name)) is None:
+                return []
+            return ALL_OBJECTS
+        return [object_id for codename, object_id in self.perms if codename == perm_name]
 
     def __bool__(self):
         if self.user.is_superuser:
             return True
-        return self.user.objectpermissions.filter(perm__content_type__app_label=self.module_name).exists()
+        return len(self.perms) > 0
 
 class ObjPermWrapper(object):
     def __init__(self, user):
         self.user = user
 
+    def _get_perms(self):
+        """Returns the obj perms of the user, grouped by app label.
+
+        All the obj perms are loaded with a single query and they are cached
+        on the user instance (for the rest of the request).
+        """
+        generation = ObjectPermissionCache().generation
+        cached = getattr(self.user, '_obj_perm_lookup_cache', None)
+        if cached is None or cached[0] != generation:
+            perms = {}
+            rows = list(self.user.objectpermissions.values_list('perm_id', 'object_id').order_by('pk'))
+            uids = PermissionUidCache().get_uids([perm_id for perm_id, object_id in rows])
+            for uid, (perm_id, object_id) in zip(uids, rows):
+                if uid:
+                    app_label, sep, codename = uid.rpartition('.')
+                    perms.setdefault(app_label, []).append((codename, object_id))
+            cached = (generation, perms)
+            self.user._obj_perm_lookup_cache = cached
+        return cached[1]
+
     def __getitem__(self, module_name):
         if self.user.is_anonymous:
             return []
-        return ObjPermLookupDict(self.user, module_name)
+        if self.user.is_superuser:
+            return ObjPermLookupDict(self.user, module_name)
+        return ObjPermLookupDict(self.user, module_name, self._get_perms().get(module_name, []))
 
     def __iter__(self):
         # I am large, I contain multitudes.
@@ -80,5 +124,5 @@ def auth(request):
         return user
 
     return {
-        'obj_perms': lazy(lambda: ObjPermWrapper(_get_user()), ObjPermWrapper)(),
+        'obj_perms': SimpleLazyObject(lambda: ObjPermWrapper(_get_user())),
     }
@@ -15,13 +15,44 @@ __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
 
-import collections
 from functools import wraps
 from urllib.parse import urlparse
 from django.conf import settings
 from django.contrib.auth import REDIRECT_FIELD_NAME
 
 
+def get_cached_object(request, func, *args, **kwargs):
+    """Returns the result of "func" invoked with the given arguments.
+
+    The result is cached on the request (keyed by function and arguments), so
+    the same object is loaded only once per request, even when it's required
+    by stacked decorators and by the decorated view itself.
+    """
+    try:
+        key = (func, args, tuple(sorted(kwargs.items())))
+        hash(key)
+    except TypeError:
+        key = None
+    cache = getattr(request, '_cached_objects', None)
+    if cache is None and key is not None:
+        try:
+            cache = request._cached_objects = {}
+        except AttributeError:
+            pass
+    if cache is None:
+        return func(*args, **kwargs)
+    if key not in cache:
+        cache[key] = func(*args, **kwargs)
+    return cache[key]
+
+def get_view_object(view, get_obj_func):
+    """Returns the obj returned by "get_obj_func" for the given view instance.
+
+    It's the same obj already loaded by "obj_permission_required" (if any).
+    """
+    request = getattr(view, 'request', None)
+    return get_cached_object(request, get_obj_func, request, *getattr(view, 'args', ()), **getattr(view, 'kwargs', {}))
+
 def obj_permission_required(perm, get_obj_func=None, login_url=None, redirect_field_name=REDIRECT_FIELD_NAME):
     """Checks if the user has "perm" for obj returned by "get_obj_func".
 
@@ -32,18 +63,21 @@ def obj_permission_required(perm, get_obj_func=None, login_url=None, redirect_fi
 
     Also "perm" could be a function which returns a permission name (invoked
     passing the arguments of the decorated view).
+
+    The obj returned by "get_obj_func" is cached on the request: views can
+    retrieve it again using "get_view_object".
     """
     def decorator(viewfunc):
         @wraps(viewfunc)
         def _wrapped_view(request, *args, **kwargs):
             obj = None
             perm_name = perm
-            if isinstance(perm, collections.Callable):
+            if callable(perm):
                 perm_name = perm(request, *args, **kwargs)
             if request.user.has_perm(perm_name):
                 return viewfunc(request, *args, **kwargs)
-            if isinstance(get_obj_func, collections.Callable):
-                obj = get_obj_func(request, *args, **kwargs)
+            if callable(get_obj_func):
+                obj = get_cached_object(request, get_obj_func, request, *args, **kwargs)
             if request.user.has_perm(perm_name, obj):
                 return viewfunc(request, *args, **kwargs)
             path = request.build_absolute_uri()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""This file is part of the django ERP project.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
+__version__ = '0.0.5'
+
+
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.contrib.auth import get_user_model
+
+from ...models import ObjectPermission, Group
+
+
+class Command(BaseCommand):
+    help = """Grants (or revokes) object permissions listed in a CSV file.
+
+Each row contains an object permission UID (i.e. "core.change_user.1") and
+the user or group it should be granted to, written as "user:<username>" or
+"group:<name>" (a bare value is a username). An optional "uid" header row is
+skipped. Rows are streamed and processed in chunks, using bulk queries."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="Path of the CSV file (\"-\" to read from stdin).")
+        parser.add_argument('--revoke', action='store_true', default=False, help="Revoke listed permissions instead of granting them.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Number of rows processed at once.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("Chunk size must be a positive number.")
+
+        if options['csv_file'] == "-":
+            self._import(sys.stdin, options['revoke'], chunk_size)
+        else:
+            try:
+                with open(options['csv_file'], newline='') as csv_file:
+                    self._import(csv_file, options['revoke'], chunk_size)
+            except IOError as e:
+                raise CommandError(e)
+
+    def _import(self, csv_file, revoke, chunk_size):
+        count = 0
+        chunk = []
+
+        for row in csv.reader(csv_file):
+            if not row or (count == 0 and not chunk and row[0].strip() == "uid"):
+                continue
+            if len(row) < 2:
+                raise CommandError("Invalid row: %s" % ",".join(row))
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                count += self._process(chunk, revoke, chunk_size)
+                chunk = []
+
+        if chunk:
+            count += self._process(chunk, revoke, chunk_size)
+
+        action = "revoked" if revoke else "granted"
+        self.stdout.write("%d object permission(s) %s." % (count, action))
+
+    def _parse_row(self, row):
+        uid, principal = row[0].strip(), row[1].strip()
+        perm_uid, sep, object_id = uid.rpartition('.')
+        if perm_uid.count('.') != 1 or not object_id.isdigit():
+            raise CommandError("Invalid object permission UID: %s" % uid)
+        kind, sep, name = principal.rpartition(':')
+        kind = kind or "user"
+        if kind not in ("user", "group"):
+            raise CommandError("Invalid user or group: %s" % principal)
+        return perm_uid, int(object_id), kind, name
+
+    def _process(self, rows, revoke, chunk_size):
+        rows = [self._parse_row(row) for row in rows]
+
+        user_ids = dict(get_user_model().objects.filter(username__in=set([name for p, o, kind, name in rows if kind == "user"])).values_list('username', 'pk'))
+        group_ids = dict(Group.objects.filter(name__in=set([name for p, o, kind, name in rows if kind == "group"])).values_list('name', 'pk'))
+
+        # Groups objects by (perm, user/group) and then users/groups sharing the
+        # same objects, so each chunk needs only a few bulk operations.
+        objects = {}
+        count = 0
+        for perm_uid, object_id, kind, name in rows:
+            pk = (user_ids if kind == "user" else group_ids).get(name, None)
+            if pk is None:
+                self.stderr.write("Unknown %s: %s" % (kind, name))
+                continue
+            objects.setdefault((perm_uid, kind, pk), set()).add(object_id)
+            count += 1
+
+        principals = {}
+        for (perm_uid, kind, pk), object_ids in objects.items():
+            principals.setdefault((perm_uid, kind, tuple(sorted(object_ids))), []).append(pk)
+
+        method = ObjectPermission.objects.revoke if revoke else ObjectPermission.objects.grant
+        with transaction.atomic():
+            for (perm_uid, kind, object_ids), pks in principals.items():
+                method(perm_uid, object_ids, chunk_size=chunk_size, **{"%ss" % kind: pks})
+
+        return count
@@ -19,11 +19,13 @@ __version__ = '0.0.5'
 
 from django.apps import apps as app_registry
 from django.db import models
-from django.db.models import Q
+from django.db.models import Q, Exists, OuterRef
 from django.utils import timezone
 from django.contrib.auth.models import BaseUserManager, PermissionManager as DjangoPermissionManager
 from django.contrib.contenttypes.models import ContentType
 
+from .cache import ObjectPermissionCache, PermissionUidCache, UserPermissionCache
+
 
 class UserManager(BaseUserManager):
     """Manager for custom User model.
@@ -67,11 +69,29 @@ class PermissionManager(DjangoPermissionManager):
         name = "Can %s %s" % (action.replace('_', ' '), model_name)
         return self.get_or_create(codename=codename, name=name, content_type_id=ct.pk)
         
+    def _get_by_cached_uid(self, uid):
+        """Returns the permission identified by uid without any join (or None).
+        """
+        pk = PermissionUidCache().get_pk(uid)
+        if pk is not None:
+            perm = self.filter(pk=pk).first()
+            if perm and perm.codename == uid.rpartition('.')[2]:
+                return perm
+            # Stale entry: force a reload on next access.
+            PermissionUidCache().clear()
+        return None
+        
     def get_by_uid(self, uid):
+        perm = self._get_by_cached_uid(uid)
+        if perm is not None:
+            return perm
         app_label, sep, codename = uid.rpartition('.')
         return self.get_by_natural_key(codename, app_label, codename.rpartition('_')[2])
         
     def get_or_create_by_uid(self, uid):
+        perm = self._get_by_cached_uid(uid)
+        if perm is not None:
+            return perm, False
         app_label, sep, codename = uid.rpartition('.')
         return self.get_or_create_by_natural_key(codename, app_label, codename.rpartition('_')[2])
         
@@ -105,8 +125,139 @@ class ObjectPermissionManager(models.Manager):
         tokens = uid.split('.')
         return self.get_or_create_by_natural_key(tokens[1], tokens[0], tokens[1].rpartition('_')[2], tokens[2])
 
+    def get_or_create_in_bulk(self, perm_ids, object_ids):
+        """Returns the object perms of all the given perm_ids on all object_ids.
+
+        Missing object perms are created with a single bulk insert.
+        """
+        perm_ids = list(perm_ids)
+        object_ids = set([int(object_id) for object_id in object_ids])
+        perms = self.filter(perm_id__in=perm_ids, object_id__in=object_ids)
+        existing = set(perms.values_list('perm_id', 'object_id').order_by())
+        missing = [self.model(perm_id=perm_id, object_id=object_id) for perm_id in perm_ids for object_id in object_ids if (perm_id, object_id) not in existing]
+        if missing:
+            self.bulk_create(missing)
+        return perms
+
+    def _get_perm_ids(self, perm_uids):
+        """Returns the pks of the given model-level perm UIDs (creating missing ones).
+        """
+        from .models import Permission
+        if isinstance(perm_uids, str):
+            perm_uids = [perm_uids]
+        perm_ids = []
+        for uid in perm_uids:
+            perm_id = PermissionUidCache().get_pk(uid)
+            if perm_id is None:
+                perm, is_new = Permission.objects.db_manager(self.db).get_or_create_by_uid(uid)
+                perm_id = perm.pk
+            perm_ids.append(perm_id)
+        return perm_ids
+
+    def _invalidate_caches(self, user_ids, group_ids):
+        # Bulk operations don't send "m2m_changed" signals.
+        ObjectPermissionCache().invalidate()
+        if group_ids:
+            UserPermissionCache().invalidate_all()
+        else:
+            UserPermissionCache().invalidate(user_ids)
+
+    def grant(self, perm_uids, objects, users=None, groups=None, chunk_size=500):
+        """Grants the given model-level perm(s) on all objects to users and groups.
+
+        perm_uids is a perm UID (i.e. "core.change_user") or a list of them,
+        while objects, users and groups can be either instances or pks. The
+        object perms and their relations are created with bulk inserts, using
+        a constant number of queries for each chunk of chunk_size objects.
+        """
+        perm_ids = self._get_perm_ids(perm_uids)
+        object_ids = [getattr(obj, 'pk', obj) for obj in objects]
+        user_ids = [getattr(user, 'pk', user) for user in (users or [])]
+        group_ids = [getattr(group, 'pk', group) for group in (groups or [])]
+        user_through = self.model.users.through
+        group_through = self.model.groups.through
+
+        for i in range(0, len(object_ids), chunk_size):
+            obj_perm_ids = list(self.get_or_create_in_bulk(perm_ids, object_ids[i:i + chunk_size]).values_list('pk', flat=True))
+            if user_ids:
+                user_through.objects.db_manager(self.db).bulk_create(
+                    [user_through(objectpermission_id=pk, user_id=user_id) for pk in obj_perm_ids for user_id in user_ids],
+                    batch_size=chunk_size,
+                    ignore_conflicts=True
+                )
+            if group_ids:
+                group_through.objects.db_manager(self.db).bulk_create(
+                    [group_through(objectpermission_id=pk, group_id=group_id) for pk in obj_perm_ids for group_id in group_ids],
+                    batch_size=chunk_size,
+                    ignore_conflicts=True
+                )
+
+        self._invalidate_caches(user_ids, group_ids)
+
+    def revoke(self, perm_uids, objects, users=None, groups=None, chunk_size=500):
+        """Revokes the given model-level perm(s) on all objects from users and groups.
+
+        If neither users nor groups are given, the object perms are revoked
+        from everyone (they are deleted).
+        """
+        perm_ids = self._get_perm_ids(perm_uids)
+        object_ids = [getattr(obj, 'pk', obj) for obj in objects]
+        user_ids = [getattr(user, 'pk', user) for user in (users or [])]
+        group_ids = [getattr(group, 'pk', group) for group in (groups or [])]
+
+        for i in range(0, len(object_ids), chunk_size):
+            perms = self.filter(perm_id__in=perm_ids, object_id__in=object_ids[i:i + chunk_size])
+            if not (user_ids or group_ids):
+                perms.delete()
+                continue
+            if user_ids:
+                self.model.users.through.objects.db_manager(self.db).filter(objectpermission__in=perms, user_id__in=user_ids).delete()
+            if group_ids:
+                self.model.groups.through.objects.db_manager(self.db).filter(objectpermission__in=perms, group_id__in=group_ids).delete()
+
+        if not (user_ids or group_ids):
+            # Deleting object perms already sends the "post_delete" signal.
+            return
+        self._invalidate_caches(user_ids, group_ids)
+
     def get_group_permissions(self, user, obj=None):
         return self.get_by_object(obj).filter(groups__user=user)
 
     def get_all_permissions(self, user, obj=None):
-        return self.get_by_object(obj).filter(Q(groups__user=user) | Q(users=user))
+        return self.get_by_object(obj).filter(Q(groups__user=user) | Q(users=user)).distinct()
+
+    def get_permitted_object_ids(self, user, perm_uid, object_ids):
+        """Returns the subset of object_ids on which user has the object perm perm_uid.
+
+        Only object perms (granted to the user or to one of his groups) are
+        checked, with a single query restricted to the given object_ids.
+        """
+        object_ids = [int(object_id) for object_id in object_ids]
+        if not object_ids or user.is_anonymous or not user.is_active:
+            return set()
+        perm_id = PermissionUidCache().get_pk(perm_uid)
+        if perm_id is None:
+            return set()
+        obj_perms = self.filter(perm_id=perm_id, object_id__in=object_ids).filter(Q(users=user) | Q(groups__user=user))
+        return set(obj_perms.values_list('object_id', flat=True).order_by().distinct())
+
+    def get_permitted_objects(self, user, perm_uid, queryset):
+        """Returns the subset of queryset on which user has perm_uid.
+
+        If the user has the model-level permission (i.e. he is allowed to act
+        on all instances) the queryset is returned as it is. Otherwise it is
+        narrowed in SQL by a single EXISTS subquery on the object permissions
+        granted to the user (or to one of his groups).
+        """
+        from .models import Permission
+        queryset = queryset.all()
+        if user.is_anonymous or not user.is_active:
+            return queryset.none()
+        if user.is_superuser or user.has_perm(perm_uid):
+            return queryset
+        try:
+            perm = Permission.objects.get_by_uid(perm_uid)
+        except Permission.DoesNotExist:
+            return queryset.none()
+        obj_perms = self.filter(perm=perm, object_id=OuterRef('pk')).filter(Q(users=user) | Q(groups__user=user))
+        return queryset.filter(Exists(obj_perms))
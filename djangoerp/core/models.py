@@ -27,6 +27,7 @@ from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, Group as DjangoGroup, Permission as DjangoPermission
 
 from .managers import *
+from .cache import PermissionUidCache
         
 def validate_json(value):
     """Validates a JSON snippet.
@@ -103,6 +104,10 @@ class Permission(DjangoPermission):
         
     @property
     def uid(self):
+        if self.pk:
+            uid = PermissionUidCache().get_uid(self.pk)
+            if uid and uid.rpartition('.')[2] == self.codename:
+                return uid
         return "%s.%s" % (self.content_type.app_label, self.codename)
 
 class ObjectPermission(models.Model):
@@ -121,7 +126,8 @@ class ObjectPermission(models.Model):
         
     @property
     def uid(self):
-        return "%s.%s" % (self.perm.uid, self.object_id)
+        perm_uid = PermissionUidCache().get_uid(self.perm_id) or self.perm.uid
+        return "%s.%s" % (perm_uid, self.object_id)
 
     def __str__(self):
         return "%s | %d" % (self.perm, self.object_id)
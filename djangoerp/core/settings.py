@@ -41,6 +41,30 @@ MIDDLEWARE += [
     'djangoerp.core.middleware.LoggedInUserCacheMiddleware',
 ]
 
+# Cache used to share user permissions across requests (None to disable it).
+# It must be shared by all the worker processes (i.e. memcached or redis, not
+# a local-memory cache), otherwise revoked permissions stay granted in the
+# other workers until they expire.
+PERMISSION_CACHE_ALIAS = None
+PERMISSION_CACHE_TIMEOUT = 60 * 60
+
+# Cache used by model lists counting their items with the "cached" strategy.
+LIST_COUNT_CACHE_ALIAS = 'default'
+LIST_COUNT_CACHE_TIMEOUT = 5 * 60
+
+# Lifetime of the cached choices of model list ForeignKey filters.
+LIST_FILTER_CHOICES_TIMEOUT = 5 * 60
+
+# Maximum duration (in ms) of each model list query, exports excluded (None to
+# disable it).
+LIST_STATEMENT_TIMEOUT = 10 * 1000
+
+# Dotted path of the callable running background deletions of model lists,
+# as "runner(func, *args)" (None to disable them). It should hand the job over
+# to a task queue: "djangoerp.core.views.run_in_thread" is only suitable for
+# single-process deployments.
+LIST_DELETE_JOB_RUNNER = None
+
 AUTHENTICATION_BACKENDS = (
     'djangoerp.core.backends.ModelBackend',
     'djangoerp.core.backends.ObjectPermissionBackend',
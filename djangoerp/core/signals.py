@@ -15,35 +15,57 @@ __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
 
-from django.conf import settings
-from django.db.models.signals import post_save
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete, post_migrate, m2m_changed
+from django.utils.autoreload import file_changed
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission as DjangoPermission, Group as DjangoGroup
 from django.contrib.contenttypes.models import ContentType
 
 from .utils.models import get_model
-from .cache import LoggedInUserCache
+from .cache import LoggedInUserCache, ObjectPermissionCache, PermissionUidCache, UserPermissionCache, TemplateFragmentCache, TemplateCache
 from .models import Permission, ObjectPermission, Group
 
 
+# User fields whose changes affect the permissions granted to the user.
+USER_PERMISSION_FIELDS = frozenset(('is_superuser', 'is_active', 'is_staff'))
+
+
 ## HANDLERS ##
 
+def _grant_default_permissions(objs, user):
+    """Grants view, change and delete perms on all objs to user (in bulk).
+    """
+    objs = [obj for obj in objs if obj.pk is not None]
+    if not objs or not user or not user.pk:
+        return
+
+    by_model = {}
+    for obj in objs:
+        by_model.setdefault(obj.__class__, []).append(obj.pk)
+
+    for model, object_ids in by_model.items():
+        content_type = ContentType.objects.get_for_model(model)
+        perm_uids = ["%s.%s_%s" % (content_type.app_label, action, content_type.model) for action in ("view", "change", "delete")]
+        ObjectPermission.objects.grant(perm_uids, object_ids, users=[user])
+
+def grant_author_permissions(objs, author):
+    """Grants default view, change and delete perms on objs to their author.
+
+    Use it for objects created with "bulk_create", which doesn't send the
+    post_save signal handled by "manage_author_permissions". i.e.:
+
+    >> projects = Project.objects.bulk_create([...])
+    >> grant_author_permissions(projects, request.user)
+    """
+    if author and author.is_authenticated:
+        _grant_default_permissions(objs, author)
+
 def _update_author_permissions(sender, instance, raw, created, **kwargs):
     """Updates the permissions assigned to the author of the given object.
     """
-    author = LoggedInUserCache().user
-    if author and author.is_authenticated:
-        content_type = ContentType.objects.get_for_model(sender)
-        app_label = content_type.app_label
-        model_name = content_type.model
-
-        if created:        
-            can_view_this_object, is_new = ObjectPermission.objects.get_or_create_by_natural_key("view_%s" % model_name, app_label, model_name, instance.pk)
-            can_change_this_object, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_%s" % model_name, app_label, model_name, instance.pk)
-            can_delete_this_object, is_new = ObjectPermission.objects.get_or_create_by_natural_key("delete_%s" % model_name, app_label, model_name, instance.pk)
-
-            can_view_this_object.users.add(author)
-            can_change_this_object.users.add(author)
-            can_delete_this_object.users.add(author)
+    if created:
+        grant_author_permissions([instance], LoggedInUserCache().user)
         
 def manage_author_permissions(cls, enabled=True):
     """Adds permissions assigned to the author of the given object.
@@ -70,26 +92,61 @@ def manage_author_permissions(cls, enabled=True):
         post_save.disconnect(_update_author_permissions, cls, dispatch_uid=dispatch_uid)
 
 def user_post_save(sender, instance, created, *args, **kwargs):
-    """Add view/delete/change object permissions to users (on themselves).
+    """Add view/delete/change object permissions to new users (on themselves).
     
     It also adds new user instances to "users" group.
     """
-    auth_app, sep, user_model_name = settings.AUTH_USER_MODEL.rpartition('.')
-    user_model_name = user_model_name.lower()
-    
-    # All new users have full control over themselves.
-    can_view_this_user, is_new = ObjectPermission.objects.get_or_create_by_natural_key("view_%s" % user_model_name, auth_app, user_model_name, instance.pk)
-    can_change_this_user, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_%s" % user_model_name, auth_app, user_model_name, instance.pk)
-    can_delete_this_user, is_new = ObjectPermission.objects.get_or_create_by_natural_key("delete_%s" % user_model_name, auth_app, user_model_name, instance.pk)
-    can_view_this_user.users.add(instance)
-    can_change_this_user.users.add(instance)
-    can_delete_this_user.users.add(instance)
-    
-    # All new users are members of "users" group.
     if created:
+        # All new users have full control over themselves.
+        _grant_default_permissions([instance], instance)
+        
+        # All new users are members of "users" group.
         users_group, is_new = Group.objects.get_or_create(name='users')
         instance.groups.add(users_group)
 
+def _invalidate_obj_perm_caches(sender, **kwargs):
+    """Discards all the cached object permissions.
+    """
+    action = kwargs.get('action', None)
+    if action is None or action.startswith("post_"):
+        ObjectPermissionCache().invalidate()
+
+def _clear_permission_uid_cache(sender, **kwargs):
+    """Forces a reload of the permission UIDs map on next access.
+    """
+    PermissionUidCache().clear()
+
+def _invalidate_user_perm_caches(sender, instance, **kwargs):
+    """Discards the shared permission caches of the users affected by a change.
+    """
+    action = kwargs.get('action', None)
+    if action is not None and not action.startswith("post_"):
+        return
+
+    User = get_user_model()
+    model = kwargs.get('model', None)
+    pk_set = kwargs.get('pk_set', None)
+
+    if isinstance(instance, User):
+        # Saving other fields (i.e. "last_login" on each login) doesn't
+        # affect permissions.
+        update_fields = kwargs.get('update_fields', None)
+        if update_fields is None or not USER_PERMISSION_FIELDS.isdisjoint(update_fields):
+            UserPermissionCache().invalidate([instance.pk])
+    elif action is None or action == "post_clear":
+        UserPermissionCache().invalidate_all()
+    elif issubclass(model, User):
+        UserPermissionCache().invalidate(pk_set)
+    elif isinstance(instance, DjangoGroup):
+        UserPermissionCache().invalidate(instance.user_set.values_list('pk', flat=True))
+    elif issubclass(model, DjangoGroup):
+        UserPermissionCache().invalidate(User.objects.filter(groups__pk__in=pk_set).values_list('pk', flat=True))
+
+def _invalidate_all_user_perm_caches(sender, **kwargs):
+    """Discards the shared permission caches of all users.
+    """
+    UserPermissionCache().invalidate_all()
+
 def add_view_permission(sender, instance, **kwargs):
     """Adds a view permission related to each new ContentType instance.
     """
@@ -97,7 +154,35 @@ def add_view_permission(sender, instance, **kwargs):
         codename = "view_%s" % instance.model
         Permission.objects.get_or_create(content_type=instance, codename=codename, name="Can view %s" % instance.name)    
 
+def _clear_template_caches(sender, **kwargs):
+    """Discards the compiled templates and the rendered fragments when
+    templates (could) change.
+    """
+    setting = kwargs.get('setting', None)
+    if setting is None or setting in ('TEMPLATES', 'THEME_PATH', 'LANGUAGE_CODE', 'INSTALLED_APPS'):
+        TemplateCache().clear()
+        TemplateFragmentCache().clear()
+
 ## CONNECTIONS ##
 
 post_save.connect(user_post_save, get_user_model())
 post_save.connect(add_view_permission, ContentType)
+m2m_changed.connect(_invalidate_obj_perm_caches, ObjectPermission.users.through)
+m2m_changed.connect(_invalidate_obj_perm_caches, ObjectPermission.groups.through)
+m2m_changed.connect(_invalidate_obj_perm_caches, get_user_model().groups.through)
+post_delete.connect(_invalidate_obj_perm_caches, ObjectPermission)
+for model in (DjangoPermission, Permission, ContentType):
+    post_save.connect(_clear_permission_uid_cache, model)
+    post_delete.connect(_clear_permission_uid_cache, model)
+    post_save.connect(_invalidate_all_user_perm_caches, model)
+    post_delete.connect(_invalidate_all_user_perm_caches, model)
+post_migrate.connect(_clear_permission_uid_cache)
+post_migrate.connect(_invalidate_all_user_perm_caches)
+for through in (ObjectPermission.users.through, ObjectPermission.groups.through, get_user_model().groups.through, get_user_model().user_permissions.through, DjangoGroup.permissions.through):
+    m2m_changed.connect(_invalidate_user_perm_caches, through)
+post_save.connect(_invalidate_user_perm_caches, get_user_model())
+post_delete.connect(_invalidate_user_perm_caches, get_user_model())
+for model in (ObjectPermission, DjangoGroup, Group):
+    post_delete.connect(_invalidate_all_user_perm_caches, model)
+file_changed.connect(_clear_template_caches)
+setting_changed.connect(_clear_template_caches)
@@ -17,15 +17,20 @@ __version__ = '0.0.5'
 
 from django.conf import settings
 from django.db import models
+from django.db.models import prefetch_related_objects
 from django.utils.encoding import force_text
 from django import template
-from django.template import Engine
+from djangoerp.core.cache import TemplateCache
 from djangoerp.core.utils.models import (
     get_model,
     get_fields,
     get_field_type,
     get_field_tuple,
+    get_related_lookups,
+    get_aggregates,
 )
+from djangoerp.core.utils.db import statement_timeout
+from djangoerp.core.utils.rendering import get_row_renderer, parse_layout, value_to_string
 
 
 register = template.Library()
@@ -95,17 +100,32 @@ def raw_model_name_plural(obj):
     
 
 @register.simple_tag(takes_context=True)
-def render_model_list(context, object_list, field_list=[], template_name=None, uid=""):
+def render_model_list(context, object_list, field_list=[], template_name=None, uid="", aggregates=False):
     """Renders a table with given fields for all given model instances.
     
-    It takes three optional arguments:
+    It takes four optional arguments:
     
      * field_list -- The list of field names to be rendered [default: all].
      * template_name -- Template that renders the list [default: elements/table_list.html]
      * uid -- An universal ID for this model list (must be unique in the template context).
+     * aggregates -- If True, column totals (sums, averages, min/max dates and
+                     value counts) of all the listed items, not just the
+                     rendered ones, are shown in the footer [default: False].
 
-    Example tag usage: {% render_model_list object_list [fields] [template_name] %}
+    Related objects of ManyToManyField columns are loaded together with the
+    list, with a fixed number of queries (ForeignKey and OneToOneField cells
+    show the raw keys).
+    
+    The object_list could also be the list of the already fetched items of a
+    page (i.e. a keyset one): the queryset is then the paginator's one.
+
+    Example tag usage: {% render_model_list object_list [fields] [template_name] [uid] [aggregates] %}
     """
+    objects = None
+    if isinstance(object_list, (list, tuple)):
+        objects = list(object_list)
+        object_list = getattr(context.get("paginator", None), "object_list", None)
+        
     if not isinstance(object_list, models.query.QuerySet):
         return ""
         
@@ -117,22 +137,42 @@ def render_model_list(context, object_list, field_list=[], template_name=None, u
         prefix = "%s_" % uid
         
     model = object_list.model
-    fields = [model._meta.get_field(n) for n in field_list] or model._meta.fields
+    render_row = get_row_renderer(model, tuple(field_list))
+    fields = render_row.fields
     filters = dict([(f.attname, ("", "")) for f in fields])
     filters.update(context.get("%slist_filter_by" % prefix, None) or {})
-    headers = [{"name": f.verbose_name, "attname": f.attname, "type": get_field_type(f), "filter": {"expr": filters[f.attname][0], "value": filters[f.attname][1]}} for f in fields]
-    rows = [{"object": o, "fields": [f.value_to_string(o) for f in fields]} for o in object_list]
-
+    filter_choices = context.get("%slist_filter_choices" % prefix, None) or {}
+    headers = [{"name": f.verbose_name, "attname": f.attname, "type": get_field_type(f), "filter": {"expr": filters[f.attname][0], "value": filters[f.attname][1], "choices": filter_choices.get(f.attname, None)}} for f in fields]
     table = {
         "uid": uid,
         "order_by": object_list.query.order_by,
         "headers": headers,
-        "rows": rows
+        "rows": [],
+        "aggregates": None,
     }
-
-    html_template = Engine.get_default().get_template(
-        template_name or settings.MODEL_LIST_DEFAULT_TEMPLATE
-    )
+    
+    # The list queries run under the statement timeout of the view (if any).
+    with statement_timeout(context.get("%slist_statement_timeout" % prefix, None), object_list.db):
+        if objects is None:
+            # An already evaluated queryset is not fetched again.
+            objects = list(object_list)
+        prefetch_related_objects(objects, *get_related_lookups(fields))
+        table["rows"] = [{"object": o, "fields": render_row(o)} for o in objects]
+        
+        if aggregates:
+            # The list could be just a page: aggregate all the listed items.
+            queryset = getattr(context.get("paginator", None), "object_list", None)
+            if not isinstance(queryset, models.query.QuerySet) or queryset.model != model:
+                queryset = model._default_manager.filter(pk__in=[o.pk for o in objects])
+            table["aggregates"] = [
+                {
+                    "aggregates": [(label, value_to_string(value)) for label, value in a["aggregates"]],
+                    "facets": [(label, count) for label, count in a["facets"] if count],
+                }
+                for a in get_aggregates(queryset, fields)
+            ]
+            
+    html_template = TemplateCache().get(template_name or settings.MODEL_LIST_DEFAULT_TEMPLATE)
     with context.push(table=table):
         result = html_template.render(context)
     return result
@@ -151,15 +191,17 @@ def render_model_details(context, objects, field_layout=[], template_name=None,
     Example tag usage: {% render_model_details "[object, form]" "[field1, [0.field2, 1.field3], field4]" %}
     """
     if objects and isinstance(objects, str):
-        objects = eval(objects, {}, context)
+        objects = [template.Variable(n).resolve(context) for n in parse_layout(objects)]
     if not isinstance(objects, (list, tuple)):
         objects = [objects]
     
     if isinstance(field_layout, str) and field_layout:
-        field_layout = eval(field_layout)
+        field_layout = parse_layout(field_layout)
     elif not field_layout:
         field_layout = []
         
+    field_lists = [get_fields(o) for o in objects]
+        
     def make_layout(field_list, objects):
         return_list = []
         for f in field_list:
@@ -168,22 +210,23 @@ def render_model_details(context, objects, field_layout=[], template_name=None,
             else:
                 on, s, fn = f.rpartition('.')
                 if on and fn:
-                    o = objects[int(on)]
+                    i = int(on)
                 elif not on:
-                    o = objects[0]
+                    i = 0
+                o = objects[i]
                 if o:
-                    label, attrs, value = get_field_tuple(fn, o)
+                    label, attrs, value = get_field_tuple(fn, o, field_lists[i])
                     return_list.append([{"name": label, "attrs": attrs, "value": value}])
         return return_list
         
     layout = make_layout(field_layout, objects)
             
     if not field_layout:
-        for o in objects:
-            for f in get_fields(o):
+        for o, field_list in zip(objects, field_lists):
+            for f in field_list:
                 #if isinstance(f, (list, tuple)):
                 #    f = f[0]
-                label, attrs, value = get_field_tuple(f, o)
+                label, attrs, value = get_field_tuple(f, o, field_list)
                 layout.append([{"name": label, "attrs": attrs, "value": value}])
                 
     num_cols = 1
@@ -196,9 +239,7 @@ def render_model_details(context, objects, field_layout=[], template_name=None,
         "layout": layout
     }
 
-    html_template = Engine.get_default().get_template(
-        template_name or settings.MODEL_DETAILS_DEFAULT_TEMPLATE
-    )
+    html_template = TemplateCache().get(template_name or settings.MODEL_DETAILS_DEFAULT_TEMPLATE)
     with context.push(details=details):
         result = html_template.render(context)
     return result
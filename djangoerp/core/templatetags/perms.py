@@ -20,28 +20,95 @@ __version__ = '0.0.5'
 from django import template
 from django.contrib import auth
 
-from ..cache import LoggedInUserCache
+from ..cache import LoggedInUserCache, ObjectPermissionCache
+from ..models import Permission, ObjectPermission
 
 
 register = template.Library()
 
 
+def _get_has_perm_cache(user):
+    """Returns the per-request cache of "user_has_perm" results of user.
+
+    Like backends' caches, it lives on the user instance itself and it's
+    discarded as soon as any object permission is granted or revoked.
+    """
+    if not user or not user.is_authenticated:
+        return None
+    generation = ObjectPermissionCache().generation
+    if getattr(user, '_has_perm_cache_generation', None) != generation:
+        user._has_perm_cache = {}
+        user._has_perm_cache_generation = generation
+    return user._has_perm_cache
+
+def _get_obj_key(obj):
+    return (obj.__class__, getattr(obj, 'pk', id(obj)))
+
+def _user_has_perm(user, perm_name, obj):
+    for backend in auth.get_backends():
+        if hasattr(backend, "has_perm"):
+            if backend.has_perm(user, perm_name):
+                return True
+            elif backend.has_perm(user, perm_name, obj):
+                return True
+                
+    return False
+
 @register.filter
 def user_has_perm(obj, perm_name):
     """Returns True if the user has permission "perm_name" over "obj".
     
     Looks for a suitable permission on both model and object-levels, iterating
-    over all installed backends.
+    over all installed backends. Results are cached for the current request.
 
     Example usage: {{ article_object|user_has_perm:"articles.change_article" }}
     """
     current_user = LoggedInUserCache().user
+    cache = _get_has_perm_cache(current_user)
     
-    for backend in auth.get_backends():
-        if hasattr(backend, "has_perm"):
-            if backend.has_perm(current_user, perm_name):
-                return True
-            elif backend.has_perm(current_user, perm_name, obj):
-                return True
-                
-    return False
+    if cache is None:
+        return _user_has_perm(current_user, perm_name, obj)
+    
+    key = (perm_name, _get_obj_key(obj))
+    if key not in cache:
+        cache[key] = _user_has_perm(current_user, perm_name, obj)
+        
+    return cache[key]
+
+@register.simple_tag
+def permitted_pks(objects, perm_name):
+    """Returns the set of pks of "objects" on which the user has "perm_name".
+    
+    Model-level permissions are checked once, while object-level ones are
+    retrieved with a single query restricted to the given objects.
+
+    Example usage:
+    
+    {% permitted_pks article_list "articles.change_article" as editable %}
+    {% for article in article_list %}{% if article.pk in editable %}...{% endif %}{% endfor %}
+    """
+    current_user = LoggedInUserCache().user
+    objects = list(objects)
+    pks = [obj.pk for obj in objects]
+    
+    if not objects or not current_user or not current_user.is_active:
+        return set()
+    
+    backends = [backend for backend in auth.get_backends() if hasattr(backend, "has_perm")]
+    
+    for backend in backends:
+        if backend.has_perm(current_user, perm_name):
+            return set(pks)
+            
+    perm_uid = perm_name.uid if isinstance(perm_name, Permission) else perm_name
+    permitted = set()
+    
+    if any(getattr(backend, "supports_object_permissions", False) for backend in backends):
+        permitted = ObjectPermission.objects.get_permitted_object_ids(current_user, perm_uid, pks)
+            
+    cache = _get_has_perm_cache(current_user)
+    if cache is not None:
+        for obj in objects:
+            cache[(perm_name, _get_obj_key(obj))] = obj.pk in permitted
+            
+    return permitted
@@ -63,3 +63,6 @@ def clear_perm_caches(user):
         delattr(user, '_user_obj_perm_cache')
     if hasattr(user, '_group_obj_perm_cache'):
         delattr(user, '_group_obj_perm_cache')
+    if hasattr(user, '_has_perm_cache'):
+        delattr(user, '_has_perm_cache')
+        delattr(user, '_has_perm_cache_generation')
@@ -16,9 +16,11 @@ __version__ = '0.0.5'
 
 
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.contrib.auth import get_user_model
 
 from . import *
+from ..cache import UserPermissionCache
 from ..models import *
 from ..backends import *
 
@@ -111,6 +113,106 @@ class ObjectPermissionBackendTestCase(TestCase):
         self.assertTrue(ob.has_perm(u2, p_name, u))
         self.assertFalse(ob.has_perm(u2, p_name, u1))
         
+    def test_cache_object_permissions(self):
+        """Tests repeated checks on the same object are served by the cache.
+        """
+        user_model = get_user_model()
+        
+        u, n = user_model.objects.get_or_create(username="u")
+        u1, n = user_model.objects.get_or_create(username="u1")
+        p = Permission.objects.get_by_natural_key("delete_user", auth_app, "user")
+        op, n = ObjectPermission.objects.get_or_create(object_id=u.pk, perm=p)
+        op.users.add(u1)
+        
+        self.assertTrue(ob.has_perm(u1, p, u))
+        
+        with self.assertNumQueries(0):
+            for i in range(10):
+                self.assertTrue(ob.has_perm(u1, p, u))
+                self.assertTrue(ob.has_perm(u1, "%s.delete_user" % auth_app, u))
+        
+    def test_invalidate_cached_object_permissions(self):
+        """Tests cached object permissions are discarded when perms change.
+        """
+        user_model = get_user_model()
+        
+        u, n = user_model.objects.get_or_create(username="u")
+        u1, n = user_model.objects.get_or_create(username="u1")
+        p = Permission.objects.get_by_natural_key("delete_user", auth_app, "user")
+        op, n = ObjectPermission.objects.get_or_create(object_id=u.pk, perm=p)
+        
+        self.assertFalse(ob.has_perm(u1, p, u))
+        
+        op.users.add(u1)
+        
+        self.assertTrue(ob.has_perm(u1, p, u))
+        
+        op.users.remove(u1)
+        
+        self.assertFalse(ob.has_perm(u1, p, u))
+        
+    def test_permission_cache_disabled_by_default(self):
+        """Tests permissions aren't cached across requests without a shared cache.
+        """
+        self.assertEqual(UserPermissionCache().cache, None)
+        
+    @override_settings(PERMISSION_CACHE_ALIAS='default')
+    def test_share_cached_permissions_across_requests(self):
+        """Tests object permissions are shared across requests until they change.
+        """
+        user_model = get_user_model()
+        
+        UserPermissionCache().invalidate_all()
+        
+        u, n = user_model.objects.get_or_create(username="u")
+        u1, n = user_model.objects.get_or_create(username="u1")
+        p = Permission.objects.get_by_natural_key("delete_user", auth_app, "user")
+        op, n = ObjectPermission.objects.get_or_create(object_id=u.pk, perm=p)
+        op.users.add(u1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(ob.has_perm(u1, p, u))
+        
+        # A new request means a new user instance.
+        u1 = user_model.objects.get(pk=u1.pk)
+        
+        with self.assertNumQueries(0):
+            self.assertTrue(ob.has_perm(u1, p, u))
+        
+        op.users.remove(u1)
+        u1 = user_model.objects.get(pk=u1.pk)
+        
+        self.assertFalse(ob.has_perm(u1, p, u))
+        
+        UserPermissionCache().invalidate_all()
+        
+    def test_load_user_and_group_permissions_at_once(self):
+        """Tests user and group object permissions are loaded with one query.
+        """
+        user_model = get_user_model()
+        
+        u, n = user_model.objects.get_or_create(username="u")
+        u1, n = user_model.objects.get_or_create(username="u1")
+        p = Permission.objects.get_by_natural_key("delete_user", auth_app, "user")
+        op, n = ObjectPermission.objects.get_or_create(object_id=u.pk, perm=p)
+        op.users.add(u1)
+        
+        # The same perm is granted through many groups.
+        for i in range(20):
+            g = Group.objects.create(name="g%d" % i)
+            g.user_set.add(u1)
+            op.groups.add(g)
+        
+        clear_perm_caches(u1)
+        
+        with self.assertNumQueries(1):
+            perms = ob.get_all_permissions(u1)
+            
+        self.assertTrue("%s.delete_user.%d" % (auth_app, u.pk) in perms)
+        
+        with self.assertNumQueries(1):
+            self.assertTrue(ob.has_perm(u1, p, u))
+        
 class IntegrationTestCase(TestCase):
     def test_integration_with_model_level_backend(self):
         """Tests correct integration with model-level perms backend.
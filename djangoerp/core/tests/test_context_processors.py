@@ -74,20 +74,14 @@ class AuthContextProcessorTestCase(TestCase):
         obj_perms = data['obj_perms']
         self.assertTrue(data['obj_perms']['core'])
         
-        self.assertEqual(
-            obj_perms['core']['change_user'],
-            [self.request.user.pk, self.request_with_superuser.user.pk]
-        )
+        # Superusers have perms on all objects, without listing them.
+        with self.assertNumQueries(0):
+            for perm_name in ('view_user', 'change_user', 'delete_user'):
+                self.assertEqual(obj_perms['core'][perm_name], ALL_OBJECTS)
+                self.assertTrue(self.request.user.pk in obj_perms['core'][perm_name])
+                self.assertTrue(self.request_with_superuser.user.pk in obj_perms['core'][perm_name])
         
-        self.assertEqual(
-            obj_perms['core']['view_user'],
-            [self.request.user.pk, self.request_with_superuser.user.pk]
-        )
-        
-        self.assertEqual(
-            obj_perms['core']['delete_user'],
-            [self.request.user.pk, self.request_with_superuser.user.pk]
-        )
+        self.assertEqual(obj_perms['core']['invalid_perm_name'], [])
         
     def test_retrieving_obj_perms(self):
         """Tests retrieving obj perms of request's user from "obj_perms" var.
@@ -112,6 +106,23 @@ class AuthContextProcessorTestCase(TestCase):
             [self.request.user.pk]
         )
         
+    def test_retrieving_obj_perms_with_a_single_query(self):
+        """Tests all obj perms are loaded once per request.
+        """
+        data = auth(self.request)
+        obj_perms = data['obj_perms']
+        
+        with self.assertNumQueries(1):
+            for i in range(5):
+                self.assertTrue(obj_perms['core'])
+                self.assertEqual(obj_perms['core']['view_user'], [self.request.user.pk])
+                self.assertFalse(obj_perms['contenttypes'])
+        
+        data = auth(self.request)
+        
+        with self.assertNumQueries(0):
+            self.assertEqual(data['obj_perms']['core']['change_user'], [self.request.user.pk])
+        
     def test_retrieving_invalid_obj_perms(self):
         """Tests retrieving invalid obj perms of request's user.
         """
@@ -157,3 +157,29 @@ class ObjPermissionRequiredTestCase(TestCase):
         response = test_decorator_view2(request, pk=self.u1.pk)
         
         self.assertEqual(response.status_code, 302)
+        
+    def test_share_object_with_view(self):
+        """Tests the object checked by the decorator is loaded once per request.
+        """
+        calls = []
+        
+        def _get_counted_user(request, *args, **kwargs):
+            calls.append(kwargs)
+            return _get_user(request, *args, **kwargs)
+        
+        @obj_permission_required("core.view_user", _get_counted_user)
+        @obj_permission_required("core.view_user", _get_counted_user)
+        def view(request, *args, **kwargs):
+            return get_cached_object(request, _get_counted_user, request, *args, **kwargs)
+        
+        request = self.factory.get('/view_user/')
+        request.user = self.u2
+        
+        self.assertEqual(view(request, pk=self.u3.pk), self.u3)
+        self.assertEqual(len(calls), 1)
+        
+        request = self.factory.get('/view_user/')
+        request.user = self.u2
+        
+        self.assertEqual(view(request, pk=self.u3.pk), self.u3)
+        self.assertEqual(len(calls), 2)
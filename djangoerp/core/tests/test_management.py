@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""This file is part of the django ERP project.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
+__version__ = '0.0.5'
+
+
+import os
+import tempfile
+from io import StringIO
+
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from . import *
+from ..models import User, Group
+
+
+class ImportObjectPermissionsCommandTestCase(TestCase):
+    def setUp(self):
+        self.u1 = User.objects.create(username="u1")
+        self.u2 = User.objects.create(username="u2")
+        self.u3 = User.objects.create(username="u3")
+        self.g = Group.objects.create(name="my_group")
+        self.g.user_set.add(self.u3)
+        
+    def _call_command(self, rows, *args):
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, 'w') as csv_file:
+            csv_file.write("\n".join(rows))
+        out = StringIO()
+        try:
+            call_command("import_object_permissions", path, *args, stdout=out, stderr=StringIO())
+        finally:
+            os.remove(path)
+        return out.getvalue()
+        
+    def test_import_object_permissions(self):
+        """Tests granting object permissions from a CSV file.
+        """
+        out = self._call_command([
+            "uid,user",
+            "%s.change_user.%d,user:u1" % (auth_app, self.u2.pk),
+            "%s.change_user.%d,u2" % (auth_app, self.u1.pk),
+            "%s.change_user.%d,group:my_group" % (auth_app, self.u1.pk),
+            "%s.change_user.%d,unknown" % (auth_app, self.u1.pk),
+        ], "--chunk-size", "2")
+        
+        self.assertEqual(out.strip(), "3 object permission(s) granted.")
+        self.assertTrue(ob.has_perm(self.u1, "%s.change_user" % auth_app, self.u2))
+        self.assertTrue(ob.has_perm(self.u2, "%s.change_user" % auth_app, self.u1))
+        self.assertTrue(ob.has_perm(self.u3, "%s.change_user" % auth_app, self.u1))
+        self.assertFalse(ob.has_perm(self.u3, "%s.change_user" % auth_app, self.u2))
+        
+    def test_revoke_object_permissions(self):
+        """Tests revoking object permissions listed in a CSV file.
+        """
+        self._call_command(["%s.change_user.%d,u1" % (auth_app, self.u2.pk)])
+        
+        self.assertTrue(ob.has_perm(self.u1, "%s.change_user" % auth_app, self.u2))
+        
+        out = self._call_command(["%s.change_user.%d,u1" % (auth_app, self.u2.pk)], "--revoke")
+        
+        self.assertEqual(out.strip(), "1 object permission(s) revoked.")
+        self.assertFalse(ob.has_perm(self.u1, "%s.change_user" % auth_app, self.u2))
+        
+    def test_fail_with_invalid_uid(self):
+        """Tests raising an error on invalid object permission UIDs.
+        """
+        self.assertRaises(CommandError, self._call_command, ["%s.change_user,u1" % auth_app])
@@ -201,3 +201,95 @@ class ObjectPermissionManagerTestCase(TestCase):
             [repr(self.op2)],
             ordered=False
         )
+
+    def test_get_permitted_objects(self):
+        """Tests "ObjectPermissionManager.get_permitted_objects" method.
+        """
+        uid = "%s.view_user" % auth_app
+        
+        self.assertQuerysetEqual(
+            ObjectPermission.objects.get_permitted_objects(self.u1, uid, User.objects.all()),
+            [repr(self.u1), repr(self.u2)],
+            ordered=False
+        )
+        self.assertQuerysetEqual(
+            ObjectPermission.objects.get_permitted_objects(self.u2, uid, User.objects.all()),
+            [repr(self.u2)],
+            ordered=False
+        )
+        self.assertQuerysetEqual(
+            ObjectPermission.objects.get_permitted_objects(self.u1, uid, User.objects.exclude(pk=self.u1.pk)),
+            [repr(self.u2)],
+            ordered=False
+        )
+        
+    def test_get_permitted_object_ids(self):
+        """Tests "ObjectPermissionManager.get_permitted_object_ids" method.
+        """
+        uid = "%s.view_user" % auth_app
+        
+        self.assertEqual(ObjectPermission.objects.get_permitted_object_ids(self.u1, uid, [self.u1.pk, self.u2.pk]), set([self.u1.pk, self.u2.pk]))
+        self.assertEqual(ObjectPermission.objects.get_permitted_object_ids(self.u1, uid, [self.u2.pk]), set([self.u2.pk]))
+        self.assertEqual(ObjectPermission.objects.get_permitted_object_ids(self.u2, uid, [self.u1.pk, self.u2.pk]), set([self.u2.pk]))
+        self.assertEqual(ObjectPermission.objects.get_permitted_object_ids(self.u1, "%s.unknown_user" % auth_app, [self.u1.pk]), set())
+        
+    def test_get_permitted_objects_with_model_perm(self):
+        """Tests getting all objects when the user has a model-level perm.
+        """
+        from ..models import Permission
+        
+        uid = "%s.view_user" % auth_app
+        self.u2.user_permissions.add(Permission.objects.get_by_uid(uid))
+        u2 = User.objects.get(pk=self.u2.pk)
+        
+        self.assertEqual(
+            ObjectPermission.objects.get_permitted_objects(u2, uid, User.objects.all()).count(),
+            User.objects.count()
+        )
+        
+    def test_grant_perms_in_bulk(self):
+        """Tests "ObjectPermissionManager.grant" method.
+        """
+        uid = "%s.delete_user" % auth_app
+        u3 = User.objects.create(username="u3")
+        objects = [self.u1, self.u2, u3]
+        
+        # Users already own delete perms on themselves, so nothing is created.
+        with self.assertNumQueries(4):
+            ObjectPermission.objects.grant(uid, objects, users=[self.u2], groups=[self.g])
+        
+        for obj in objects:
+            self.assertTrue(ob.has_perm(self.u2, uid, obj))
+            self.assertTrue(ob.has_perm(self.u1, uid, obj))
+        self.assertFalse(ob.has_perm(u3, uid, self.u1))
+        self.assertFalse(ob.has_perm(u3, uid, self.u2))
+        
+        # Granting twice doesn't duplicate anything.
+        ObjectPermission.objects.grant(uid, [obj.pk for obj in objects], users=[self.u2.pk], chunk_size=2)
+        
+        self.assertEqual(ObjectPermission.objects.filter(perm__codename="delete_user", object_id__in=[obj.pk for obj in objects]).count(), 3)
+        self.assertEqual(self.u2.objectpermissions.filter(perm__codename="delete_user").count(), 3)
+        
+    def test_revoke_perms_in_bulk(self):
+        """Tests "ObjectPermissionManager.revoke" method.
+        """
+        uid = "%s.view_user" % auth_app
+        
+        self.assertTrue(ob.has_perm(self.u1, uid, self.u1))
+        self.assertTrue(ob.has_perm(self.u1, uid, self.u2))
+        self.assertTrue(ob.has_perm(self.u2, uid, self.u2))
+        
+        ObjectPermission.objects.revoke(uid, [self.u1, self.u2], users=[self.u1])
+        
+        self.assertFalse(ob.has_perm(self.u1, uid, self.u1))
+        self.assertTrue(ob.has_perm(self.u1, uid, self.u2))
+        
+        ObjectPermission.objects.revoke(uid, [self.u2], groups=[self.g])
+        
+        self.assertFalse(ob.has_perm(self.u1, uid, self.u2))
+        self.assertTrue(ob.has_perm(self.u2, uid, self.u2))
+        
+        ObjectPermission.objects.revoke(uid, [self.u2])
+        
+        self.assertFalse(ob.has_perm(self.u2, uid, self.u2))
+        self.assertFalse(ObjectPermission.objects.filter(pk=self.op2.pk).exists())
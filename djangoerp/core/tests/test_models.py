@@ -76,6 +76,52 @@ class GroupModelTestCase(TestCase):
         
         self.assertEqual("%s" % g, "users")
         
+class PermissionModelTestCase(TestCase):
+    def test_uid_without_queries(self):
+        """Tests resolving the UID of a permission without hitting the database.
+        """
+        from ..cache import PermissionUidCache
+        
+        p = Permission.objects.get(codename="view_user", content_type__app_label="core")
+        PermissionUidCache().load()
+        
+        with self.assertNumQueries(0):
+            self.assertEqual(p.uid, "core.view_user")
+            
+    def test_uid_of_new_permission(self):
+        """Tests new permissions are registered as soon as they are saved.
+        """
+        from django.contrib.contenttypes.models import ContentType
+        from ..cache import PermissionUidCache
+        
+        PermissionUidCache().load()
+        ct = ContentType.objects.get_for_model(User)
+        p = Permission.objects.create(codename="approve_user", name="Can approve user", content_type=ct)
+        
+        self.assertEqual(PermissionUidCache().get_pk("core.approve_user"), p.pk)
+        self.assertEqual(PermissionUidCache().get_uid(p.pk), "core.approve_user")
+        self.assertEqual(Permission.objects.get_by_uid("core.approve_user"), p)
+        
+    def test_unknown_uid_reloads_once(self):
+        """Tests unknown UIDs and primary keys are looked up only once.
+        """
+        from django.contrib.contenttypes.models import ContentType
+        from ..cache import PermissionUidCache
+        
+        PermissionUidCache().load()
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(PermissionUidCache().get_pk("core.missing_perm"), None)
+            self.assertEqual(PermissionUidCache().get_pk("core.missing_perm"), None)
+        with self.assertNumQueries(1):
+            self.assertEqual(PermissionUidCache().get_uids([-1, -1]), [None, None])
+            self.assertEqual(PermissionUidCache().get_uid(-1), None)
+            
+        ct = ContentType.objects.get_for_model(User)
+        p = Permission.objects.create(codename="missing_perm", name="Missing perm", content_type=ct)
+        
+        self.assertEqual(PermissionUidCache().get_pk("core.missing_perm"), p.pk)
+        
 class ObjectPermissionModelTestCase(TestCase):
     def test_unicode(self):
         """Tests getting correct unicode representation.
@@ -17,7 +17,7 @@ __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 
 from . import *
@@ -132,3 +132,74 @@ class SignalTestCase(TestCase):
         
         # Restores previous cached user.
         logged_cache.user = prev_user
+        
+    def test_grant_author_permissions(self):
+        """Tests granting author perms on bulk created objects. 
+        """
+        user_model = get_user_model()
+        
+        u3, n = user_model.objects.get_or_create(username="u3")
+        user_model.objects.bulk_create([user_model(username="u9"), user_model(username="u10")])
+        u9 = user_model.objects.get(username="u9")
+        u10 = user_model.objects.get(username="u10")
+        
+        clear_perm_caches(u3)
+        
+        self.assertFalse(ob.has_perm(u3, "%s.view_user" % auth_app, u9))
+        self.assertFalse(ob.has_perm(u3, "%s.delete_user" % auth_app, u10))
+        
+        # Perms are resolved once per model and inserted in bulk.
+        with self.assertNumQueries(4):
+            grant_author_permissions([u9, u10], u3)
+        
+        self.assertTrue(ob.has_perm(u3, "%s.view_user" % auth_app, u9))
+        self.assertTrue(ob.has_perm(u3, "%s.change_user" % auth_app, u9))
+        self.assertTrue(ob.has_perm(u3, "%s.delete_user" % auth_app, u9))
+        self.assertTrue(ob.has_perm(u3, "%s.view_user" % auth_app, u10))
+        self.assertTrue(ob.has_perm(u3, "%s.change_user" % auth_app, u10))
+        self.assertTrue(ob.has_perm(u3, "%s.delete_user" % auth_app, u10))
+        
+        # Granting twice doesn't duplicate anything.
+        grant_author_permissions([u9, u10], u3)
+        
+        self.assertEqual(ObjectPermission.objects.filter(object_id__in=[u9.pk, u10.pk], perm__codename__in=["view_user", "change_user", "delete_user"]).count(), 6)
+        self.assertEqual(u3.objectpermissions.filter(object_id__in=[u9.pk, u10.pk], perm__codename__in=["view_user", "change_user", "delete_user"]).count(), 6)
+        
+    @override_settings(PERMISSION_CACHE_ALIAS='default')
+    def test_user_post_save_only_on_relevant_changes(self):
+        """Tests saving a user grants perms only once and invalidates its cached perms only when needed.
+        """
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.utils import timezone
+        from ..cache import UserPermissionCache
+        
+        user_model = get_user_model()
+        u = user_model.objects.create(username="u")
+        key = UserPermissionCache()._get_key(u, "all")
+        
+        self.assertTrue(ob.has_perm(u, "%s.change_user" % auth_app, u))
+        
+        # i.e. on login.
+        u.last_login = timezone.now()
+        with CaptureQueriesContext(connection) as ctx:
+            u.save(update_fields=["last_login"])
+        
+        writes = [q["sql"] for q in ctx.captured_queries if not q["sql"].startswith("SELECT")]
+        self.assertEqual(len(writes), 1)
+        self.assertFalse([q for q in ctx.captured_queries if "core_objectpermission" in q["sql"]])
+        self.assertEqual(UserPermissionCache()._get_key(u, "all"), key)
+        
+        u.objectpermissions.clear()
+        u.save()
+        
+        self.assertEqual(u.objectpermissions.count(), 0)
+        self.assertNotEqual(UserPermissionCache()._get_key(u, "all"), key)
+        
+        key = UserPermissionCache()._get_key(u, "all")
+        u.is_active = False
+        u.save(update_fields=["is_active"])
+        
+        self.assertNotEqual(UserPermissionCache()._get_key(u, "all"), key)
+        
+        UserPermissionCache().invalidate_all()
@@ -15,6 +15,7 @@ __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
 
+from django.conf import settings
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.utils.safestring import mark_safe
@@ -355,6 +356,125 @@ class ModelListTagTestCase(TestCase):
             render_to_string("elements/model_list.html", {"table": table_dict})
         )
         
+    def test_render_related_columns_with_fixed_queries(self):
+        """Tests rendering related columns doesn't cost a query per row.
+        """
+        u1 = get_user_model().objects.create(username="u1")
+        ObjectPermission.objects.grant(["%s.view_user" % auth_app, "%s.change_user" % auth_app], range(1000, 1025), users=[u1])
+        qs = ObjectPermission.objects.filter(object_id__gte=1000)
+        
+        self.assertEqual(qs.count(), 50)
+        
+        # FK columns show the raw keys, the related objects of M2M columns
+        # are loaded at once.
+        with self.assertNumQueries(2):
+            output = render_model_list(Context(), qs, ["object_id", "perm", "users"])
+            
+        self.assertRegex(output, r"<td>\s*%d\s*</td>" % qs[0].perm_id)
+        self.assertFalse("%s" % qs[0].perm in output)
+        self.assertTrue("User: u1" in output)
+        
+        # An already evaluated list is not retrieved again.
+        qs = ObjectPermission.objects.filter(object_id__gte=1000)
+        list(qs)
+        
+        with self.assertNumQueries(2):
+            render_model_list(Context(), qs, ["object_id", "users", "groups"])
+            
+        # The fetched items of a keyset page, with the paginator's queryset.
+        from ..utils.pagination import KeysetPaginator
+        paginator = KeysetPaginator(ObjectPermission.objects.filter(object_id__gte=1000), 10)
+        page = paginator.page()
+        
+        with self.assertNumQueries(2):
+            output = render_model_list(Context({"paginator": paginator}), page.object_list, ["object_id", "users", "groups"])
+            
+        self.assertTrue("User: u1" in output)
+        self.assertEqual(render_model_list(Context(), page.object_list), "")
+        
+    def test_render_aggregates(self):
+        """Tests rendering column totals of the whole list in the footer.
+        """
+        from django.core.paginator import Paginator
+        
+        user_model = get_user_model()
+        for i in range(4):
+            user_model.objects.create(username="u%d" % i, is_staff=(i == 0))
+        qs = user_model.objects.filter(username__startswith="u").order_by("username")
+        
+        output = render_model_list(Context(), qs.all(), ["username", "is_staff"])
+        
+        self.assertFalse('class="aggregates"' in output)
+        
+        paginator = Paginator(qs, 2)
+        page = paginator.page(1)
+        
+        # 1 query for the page items + 1 for all the aggregates.
+        with self.assertNumQueries(2):
+            output = render_model_list(Context({"paginator": paginator}), page.object_list, ["username", "is_staff"], aggregates=True)
+            
+        self.assertTrue('class="aggregates"' in output)
+        self.assertTrue('<em>Yes:</em> 1' in output)
+        self.assertTrue('<em>No:</em> 3' in output)
+        
+    def test_render_autocomplete_filter(self):
+        """Tests rendering an autocomplete input for FK filters with too many choices.
+        """
+        qs = ObjectPermission.objects.all()
+        context = Context({"mytable_list_filter_choices": {"perm_id": {"choices": [], "autocomplete": True}}})
+        
+        output = render_model_list(context, qs, ["perm"], uid="mytable")
+        
+        self.assertTrue('class="autocomplete" data-autocomplete-url="?mytable_autocomplete=perm_id" data-autocomplete-term="mytable_term"' in output)
+        
+    def test_render_export_links(self):
+        """Tests export links keep the (encoded) query string of the list.
+        """
+        from django.test import RequestFactory
+        
+        get_user_model().objects.create(username="u1")
+        request = RequestFactory().get("/users/", {"filter_by_username": "a&b=c", "order by": "-username"})
+        
+        output = render_model_list(Context({"request": request}), get_user_model().objects.all(), ["username"])
+        
+        self.assertTrue('href="/users/?filter_by_username=a%26b%3Dc&amp;order+by=-username&amp;export=csv"' in output)
+        
+    def test_render_under_statement_timeout(self):
+        """Tests list queries are cancelled after the statement timeout of the view.
+        """
+        from django.db import connection
+        from ..utils.db import StatementTimeout
+        
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest("Statement timeouts are not supported.")
+            
+        get_user_model().objects.create(username="u1")
+        qs = get_user_model().objects.extra(where=["EXISTS (WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT x FROM (SELECT x FROM c LIMIT 100000000) AS t WHERE x < 0)"])
+        
+        self.assertRaises(StatementTimeout, render_model_list, Context({"list_statement_timeout": 10}), qs, ["username"])
+        
+class TemplateCacheTestCase(TestCase):
+    def test_cache_compiled_templates(self):
+        """Tests rendering tags load each template only once until templates change.
+        """
+        from django.template.autoreload import get_template_directories
+        from django.utils.autoreload import file_changed
+        from ..cache import TemplateCache
+        
+        TemplateCache().clear()
+        g, n = Group.objects.get_or_create(name="g")
+        render_model_details(Context(), g)
+        html_template = TemplateCache().get(settings.MODEL_DETAILS_DEFAULT_TEMPLATE)
+        
+        render_model_details(Context(), g)
+        
+        self.assertTrue(TemplateCache().get(settings.MODEL_DETAILS_DEFAULT_TEMPLATE) is html_template)
+        
+        template_dir = sorted(get_template_directories())[0]
+        file_changed.send(sender=None, file_path=template_dir / settings.MODEL_DETAILS_DEFAULT_TEMPLATE)
+        
+        self.assertFalse(TemplateCache().get(settings.MODEL_DETAILS_DEFAULT_TEMPLATE) is html_template)
+        
 class ModelDetailsTagTestCase(TestCase):
     def test_render_empty_model_details(self):
         """Tests rendering an empty model details table.
@@ -555,6 +675,63 @@ class UserHasPermTagTestCase(TestCase):
         # Restores previous cached user.
         logged_cache.user = prev_user
         
+    def test_cache_user_has_perm(self):
+        """Tests that "user_has_perm" results are cached for the request.
+        """
+        u7, n = get_user_model().objects.get_or_create(username="u7")
+        u8, n = get_user_model().objects.get_or_create(username="u8")
+        
+        prev_user = logged_cache.user
+        logged_cache.user = u7
+        
+        self.assertFalse(user_has_perm(u8, "%s.view_user" % auth_app))
+        
+        with self.assertNumQueries(0):
+            for i in range(5):
+                self.assertFalse(user_has_perm(u8, "%s.view_user" % auth_app))
+                
+        op, n = ObjectPermission.objects.get_or_create_by_uid("%s.view_user.%s" % (auth_app, u8.pk))
+        u7.objectpermissions.add(op)
+        
+        self.assertTrue(user_has_perm(u8, "%s.view_user" % auth_app))
+        
+        # Restores previous cached user.
+        logged_cache.user = prev_user
+        
+    def test_permitted_pks(self):
+        """Tests that "permitted_pks" checks a perm over many objects at once.
+        """
+        u7, n = get_user_model().objects.get_or_create(username="u7")
+        u8, n = get_user_model().objects.get_or_create(username="u8")
+        u9, n = get_user_model().objects.get_or_create(username="u9")
+        
+        prev_user = logged_cache.user
+        logged_cache.user = u7
+        
+        ObjectPermission.objects.grant("%s.change_user" % auth_app, [u8], users=[u7])
+        clear_perm_caches(u7)
+        
+        with self.assertNumQueries(3):
+            self.assertEqual(permitted_pks([u7, u8, u9], "%s.change_user" % auth_app), set([u7.pk, u8.pk]))
+        
+        # Results are shared with "user_has_perm".
+        with self.assertNumQueries(0):
+            self.assertTrue(user_has_perm(u8, "%s.change_user" % auth_app))
+            self.assertFalse(user_has_perm(u9, "%s.change_user" % auth_app))
+        
+        p, n = Permission.objects.get_or_create_by_uid("%s.change_user" % auth_app)
+        u7.user_permissions.add(p)
+        clear_perm_caches(u7)
+        
+        self.assertEqual(permitted_pks([u7, u8, u9], "%s.change_user" % auth_app), set([u7.pk, u8.pk, u9.pk]))
+        
+        logged_cache.user = None
+        
+        self.assertEqual(permitted_pks([u7, u8, u9], "%s.change_user" % auth_app), set())
+        
+        # Restores previous cached user.
+        logged_cache.user = prev_user
+        
 @override_settings(ROOT_URLCONF='djangoerp.core.tests.urls')
 class BreadcrumbsTagsTestCase(TestCase):
     
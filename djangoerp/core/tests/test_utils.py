@@ -15,6 +15,7 @@ __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
 
+import json
 from django.test import TestCase
 from django.db import models
 from django import forms
@@ -24,12 +25,14 @@ from django.template.loader import render_to_string
 
 from . import *
 from .models import *
-from ..models import Group, User
+from ..models import Group, User, ObjectPermission
 from ..forms.auth import UserForm
 from ..utils import *
 from ..utils.models import *
+from ..utils.db import *
 from ..utils.dependencies import *
 from ..utils.rendering import *
+from ..utils.pagination import *
           
 
 class GetModelTestCase(TestCase):
@@ -98,6 +101,22 @@ class GetFieldsTestCase(TestCase):
         self.assertTrue("password" in fields)
         self.assertTrue(isinstance(fields["password"], models.Field))
         
+    def test_get_model_field_map(self):
+        """Tests the field map is built once per model class.
+        """
+        u2 = User.objects.create(username="u2", email="u2@u.it", password="password")
+        fields = get_field_map(User)
+        
+        self.assertTrue(get_fields(self.u) is fields)
+        self.assertTrue(get_fields(u2) is fields)
+        self.assertEqual(set(get_field_map(User, by_attname=True)), set([f.attname for f in User._meta.fields]))
+        
+        # Reloading the model options rebuilds the map.
+        User._meta._expire_cache()
+        
+        self.assertFalse(get_field_map(User) is fields)
+        self.assertEqual(get_field_map(User), fields)
+        
     def test_get_form_fields(self):
         """Tests retrieving a dict containing all fields of a form instance.
         """
@@ -114,6 +133,272 @@ class GetFieldsTestCase(TestCase):
         self.assertTrue("password2" in fields)
         self.assertTrue(isinstance(fields["password2"], forms.Field))
           
+class GetAggregatesTestCase(TestCase):
+    def test_get_aggregates(self):
+        """Tests computing per-field aggregates with a query plus one per facet field.
+        """
+        from datetime import datetime
+        from django.utils import timezone
+        
+        d1 = timezone.make_aware(datetime(2015, 1, 1))
+        d2 = timezone.make_aware(datetime(2015, 3, 1))
+        User.objects.create(username="u1", is_staff=True, date_joined=d1, language="en")
+        User.objects.create(username="u2", date_joined=d2, language="en")
+        User.objects.create(username="u3", date_joined=d2, language="it")
+        opts = User._meta
+        fields = [opts.get_field(n) for n in ("username", "is_staff", "date_joined", "language")]
+        
+        # Min/max dates + "is_staff" facets + "language" facets.
+        with self.assertNumQueries(3):
+            aggregates = get_aggregates(User.objects.filter(username__startswith="u").order_by("username")[:1], fields)
+            
+        self.assertEqual(aggregates[0], {"aggregates": [], "facets": []})
+        self.assertEqual(aggregates[1], {"aggregates": [], "facets": [("Yes", 1), ("No", 0)]})
+        self.assertEqual(aggregates[2], {"aggregates": [("Min", d1), ("Max", d1)], "facets": []})
+        self.assertEqual(dict(aggregates[3]["facets"])["English"], 1)
+        
+        aggregates = get_aggregates(User.objects.filter(username__startswith="u"), fields)
+        
+        self.assertEqual(aggregates[1]["facets"], [("Yes", 1), ("No", 2)])
+        self.assertEqual(aggregates[2]["aggregates"], [("Min", d1), ("Max", d2)])
+        self.assertEqual(dict(aggregates[3]["facets"])["Italian"], 1)
+        
+    def test_get_numeric_aggregates(self):
+        """Tests summing and averaging numeric fields.
+        """
+        ObjectPermission.objects.grant("%s.view_user" % auth_app, [1000, 1002], users=[])
+        field = ObjectPermission._meta.get_field("object_id")
+        
+        aggregates = get_aggregates(ObjectPermission.objects.filter(object_id__gte=1000), [field])
+        
+        self.assertEqual(aggregates[0]["aggregates"], [("Sum", 2002), ("Average", 1001)])
+        
+class DeleteInChunksTestCase(TestCase):
+    def test_delete_in_chunks(self):
+        """Tests deleting objects in batches, each one in a transaction.
+        """
+        for i in range(5):
+            User.objects.create(username="u%d" % i)
+        progress = []
+        
+        deleted = delete_in_chunks(User.objects.filter(username__startswith="u"), 2, progress.append)
+        
+        self.assertEqual(deleted, 5)
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertFalse(User.objects.filter(username__startswith="u").exists())
+        
+class StatementTimeoutTestCase(TestCase):
+    def test_cancel_long_query(self):
+        """Tests cancelling queries lasting more than the given timeout.
+        """
+        from django.db import connection
+        
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest("Statement timeouts are not supported.")
+            
+        sql = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM (SELECT x FROM c LIMIT 100000000) AS t"
+        
+        with self.assertRaises(StatementTimeout):
+            with statement_timeout(10):
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+                    
+        # Fast queries are not affected.
+        with statement_timeout(10 * 1000):
+            self.assertEqual(User.objects.filter(username="nobody").count(), 0)
+            
+    def test_timeout_per_query(self):
+        """Tests the timeout applies to each query, not to the whole block.
+        """
+        import time
+        from django.db import connection
+        
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest("Statement timeouts are not supported.")
+            
+        sql = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM (SELECT x FROM c LIMIT 10000) AS t"
+        
+        with statement_timeout(50):
+            for i in range(3):
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+                    self.assertEqual(cursor.fetchone()[0], 10000)
+                time.sleep(0.05)
+            
+class KeysetPaginatorTestCase(TestCase):
+    def setUp(self):
+        for i in range(7):
+            User.objects.create(username="u%d" % i, email="u%d@u.it" % (i % 3))
+            
+    def walk(self, queryset, per_page):
+        paginator = KeysetPaginator(queryset, per_page)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_page_number()))
+        return paginator, pages
+            
+    def test_walk_forward_and_backward(self):
+        """Tests walking through all pages in both directions.
+        """
+        qs = User.objects.order_by("-email")
+        paginator, pages = self.walk(qs, 3)
+        
+        self.assertEqual(len(pages), 3)
+        self.assertFalse(pages[0].has_previous())
+        self.assertEqual([u.pk for p in pages for u in p], [u.pk for u in qs.order_by("-email", "pk")])
+        
+        for i in range(len(pages) - 1, 0, -1):
+            previous = paginator.page(pages[i].previous_page_number())
+            self.assertEqual(list(previous), list(pages[i - 1]))
+            
+        self.assertFalse(paginator.page(pages[1].previous_page_number()).has_previous())
+        
+    def test_walk_nullable_ordering(self):
+        """Tests walking through pages sorted by a nullable field.
+        """
+        from datetime import timedelta
+        from django.utils import timezone
+        
+        now = timezone.now()
+        for i, u in enumerate(User.objects.order_by("pk")[:4]):
+            u.last_login = now - timedelta(days=i % 2)
+            u.save()
+            
+        for order_by in ("last_login", "-last_login"):
+            qs = User.objects.order_by(order_by)
+            paginator, pages = self.walk(qs, 2)
+            users = [u for p in pages for u in p]
+            
+            self.assertEqual(len(users), 7)
+            self.assertEqual(len(set(u.pk for u in users)), 7)
+            logins = [u.last_login for u in users]
+            if order_by.startswith("-"):
+                self.assertEqual(logins[:3], [None] * 3)
+                self.assertEqual(logins[3:], sorted(logins[3:], reverse=True))
+            else:
+                self.assertEqual(logins[4:], [None] * 3)
+                self.assertEqual(logins[:4], sorted(logins[:4]))
+                
+            for i in range(len(pages) - 1, 0, -1):
+                previous = paginator.page(pages[i].previous_page_number())
+                self.assertEqual(list(previous), list(pages[i - 1]))
+                
+    def test_same_cost_on_every_page(self):
+        """Tests that every page is retrieved with a single query.
+        """
+        paginator, pages = self.walk(User.objects.all(), 2)
+        
+        for page in pages:
+            with self.assertNumQueries(1):
+                list(paginator.page(page.next_page_number() if page.has_next() else None))
+                
+    def test_page_object_list_is_fetched(self):
+        """Tests the page's object list is the list of the fetched rows.
+        """
+        paginator = KeysetPaginator(User.objects.order_by("username"), 4)
+        page = paginator.page()
+        
+        with self.assertNumQueries(0):
+            self.assertEqual([u.username for u in page.object_list], ["u0", "u1", "u2", "u3"])
+            
+        self.assertEqual(paginator.object_list.query.order_by, ("username", "pk"))
+        
+    def test_invalid_cursor(self):
+        """Tests an invalid cursor raises InvalidPage.
+        """
+        from base64 import urlsafe_b64encode
+        from django.core.paginator import InvalidPage
+        
+        paginator = KeysetPaginator(User.objects.all(), 3)
+        
+        self.assertEqual(list(paginator.page("")), list(paginator.page()))
+        self.assertRaises(InvalidPage, paginator.page, "invalid!")
+        self.assertRaises(InvalidPage, paginator.page, "1")
+        
+        # Well-formed cursors with values of the wrong type.
+        for values in (["abc"], [["abc"]], [None]):
+            cursor = urlsafe_b64encode(json.dumps(["n", values]).encode("utf-8")).decode("ascii")
+            self.assertRaises(InvalidPage, paginator.page, cursor)
+            
+        # Values are converted to the types of the ordering fields.
+        cursor = urlsafe_b64encode(json.dumps(["n", ["%d" % User.objects.order_by("pk")[2].pk]]).encode("utf-8")).decode("ascii")
+        
+        self.assertEqual(list(paginator.page(cursor)), list(User.objects.order_by("pk")[3:6]))
+            
+class CountingPaginatorTestCase(TestCase):
+    def setUp(self):
+        for i in range(7):
+            User.objects.create(username="u%d" % i)
+        self.qs = User.objects.order_by("username")
+        self.total = self.qs.count()
+            
+    def test_exact_count(self):
+        """Tests the default strategy performs an exact count.
+        """
+        paginator = CountingPaginator(self.qs, 3)
+        
+        self.assertEqual(paginator.count, self.total)
+        self.assertTrue(paginator.count_is_exact)
+        self.assertEqual(paginator.display_count, "%d" % self.total)
+        
+    def test_cached_count(self):
+        """Tests the cached strategy shares counts of the same filtered query.
+        """
+        from django.core.cache import cache
+        cache.clear()
+        qs = self.qs.filter(username__startswith="u")
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(CountingPaginator(qs, 3, count_strategy="cached").count, 7)
+            self.assertEqual(CountingPaginator(qs, 3, count_strategy="cached").count, 7)
+            
+        with self.assertNumQueries(1):
+            self.assertEqual(CountingPaginator(qs.filter(username="u1"), 3, count_strategy="cached").count, 1)
+            
+        cache.clear()
+        
+    def test_capped_count(self):
+        """Tests the capped strategy stops counting after the given limit.
+        """
+        paginator = CountingPaginator(self.qs, 2, count_strategy="capped", count_limit=3)
+        
+        self.assertEqual(paginator.count, 4)
+        self.assertFalse(paginator.count_is_exact)
+        self.assertEqual(paginator.display_count, "3+")
+        
+        paginator = CountingPaginator(self.qs, 2, count_strategy="capped", count_limit=100)
+        
+        self.assertEqual(paginator.count, self.total)
+        self.assertTrue(paginator.count_is_exact)
+        
+    def test_capped_count_reaches_last_page(self):
+        """Tests pages beyond the capped count are still reachable.
+        """
+        paginator = CountingPaginator(self.qs, 2, count_strategy="capped", count_limit=1)
+        page = paginator.page(3)
+        
+        self.assertEqual(list(page.object_list), list(self.qs[4:6]))
+        self.assertTrue(page.has_next())
+        
+        last_page = paginator.page(paginator.num_pages)
+        
+        self.assertEqual(list(last_page.object_list), list(self.qs[(paginator.num_pages - 1) * 2:]))
+        self.assertFalse(last_page.has_next())
+        self.assertTrue(paginator.count_is_exact)
+        
+    def test_estimated_count(self):
+        """Tests the estimated strategy falls back to capped without statistics.
+        """
+        paginator = CountingPaginator(self.qs.filter(username__startswith="u"), 2, count_strategy="estimated", count_limit=3)
+        
+        self.assertEqual(paginator.count, 4)
+        self.assertFalse(paginator.count_is_exact)
+        
+    def test_invalid_strategy(self):
+        """Tests an unknown count strategy is refused.
+        """
+        self.assertRaises(ValueError, CountingPaginator, self.qs, 2, count_strategy="unknown")
+            
 class CleanHTTPRefererTestCase(TestCase):
     def test_no_request(self):
         """Tests when there isn't a request, default_referer must be returned.
@@ -229,6 +514,27 @@ class RenderingValueToStringTestCase(TestCase):
             mark_safe(render_to_string('elements/no.html', {}).strip())
         )
 
+    def test_cached_fragments(self):
+        """Tests constant fragments are rendered only once until templates change.
+        """
+        from pathlib import Path
+        from django.utils.autoreload import file_changed
+        from ..cache import TemplateFragmentCache
+        
+        TemplateFragmentCache().clear()
+        
+        with self.assertTemplateUsed('elements/yes.html'):
+            yes = value_to_string(True)
+            
+        with self.assertTemplateNotUsed('elements/yes.html'):
+            for i in range(500):
+                self.assertEqual(value_to_string(True), yes)
+                
+        file_changed.send(sender=None, file_path=Path(__file__))
+        
+        with self.assertTemplateUsed('elements/yes.html'):
+            value_to_string(True)
+
     def test_float_value_to_string(self):
         """Tests rendering of a float value.
         """
@@ -347,6 +653,32 @@ class RenderingFieldToValueTestCase(TestCase):
             False
         )
    
+class RenderingGetRowRendererTestCase(TestCase):
+    def test_row_renderer(self):
+        """Tests rendering list rows with a cached per-model renderer.
+        """
+        u1 = User.objects.create(username="u1", email="u1@u.it")
+        render_row = get_row_renderer(User, ("username", "email", "is_staff"))
+        
+        self.assertTrue(get_row_renderer(User, ("username", "email", "is_staff")) is render_row)
+        self.assertEqual([f.name for f in render_row.fields], ["username", "email", "is_staff"])
+        self.assertEqual(render_row(u1), [field_to_cell(f, u1) for f in render_row.fields])
+        self.assertEqual(render_row(u1), ["u1", "u1@u.it", "False"])
+        self.assertEqual(len(get_row_renderer(User).fields), len(User._meta.fields))
+        
+class RenderingParseLayoutTestCase(TestCase):
+    def test_parse_layout(self):
+        """Tests parsing layout strings in nested tuples of names.
+        """
+        self.assertEqual(parse_layout("object"), ("object",))
+        self.assertEqual(parse_layout("[u1, u2]"), ("u1", "u2"))
+        self.assertEqual(parse_layout("[field1, [0.field2, 1.field3], field4]"), ("field1", ("0.field2", "1.field3"), "field4"))
+        self.assertEqual(parse_layout("['0.username:(user)', \"1.username:(another user)\"]"), ("0.username:(user)", "1.username:(another user)"))
+        self.assertEqual(parse_layout("[[a, b]]"), (("a", "b"),))
+        self.assertEqual(parse_layout(""), ())
+        self.assertRaises(ValueError, parse_layout, "[a, [b]")
+        self.assertRaises(ValueError, parse_layout, "a]")
+        
 class RenderingGetFieldTypeTestCase(TestCase):
     def test_get_type_for_field(self):
         """Tests returning a string representing the type of a field.
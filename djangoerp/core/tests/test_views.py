@@ -21,10 +21,11 @@ from django.shortcuts import resolve_url
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 
-from . import FakeRequest
+from . import FakeRequest, auth_app
 from ..models import User, ObjectPermission
 from ..views import _get_user # Is not in the public API.
 from ..views import *
+from ..utils.db import StatementTimeout
 
 
 class GetterTestCase(TestCase):
@@ -104,6 +105,84 @@ class BaseModelListViewTestCase(TestCase):
         
         self.assertEqual(v.page_kwarg, "my_list_page")
      
+    def test_paginate_queryset_by_keyset(self):
+        """Tests keyset pagination with prefixed cursor kwarg.
+        """
+        for i in range(5):
+            User.objects.create(username="user%d" % i)
+            
+        v = BaseModelListView()
+        v.kwargs = {}
+        v.request = FakeRequest()
+        v.list_uid = "my_list"
+        v.paginate_by_keyset = True
+        qs = User.objects.order_by("-username")
+        
+        paginator, page, object_list, is_paginated = v.paginate_queryset(qs, 2)
+        
+        self.assertEqual(v.page_kwarg, "my_list_page")
+        self.assertTrue(is_paginated)
+        self.assertEqual(paginator.count, None)
+        self.assertEqual(list(object_list), list(qs[:2]))
+        
+        v.request.GET = {"my_list_page": page.next_page_number()}
+        paginator, page, object_list, is_paginated = v.paginate_queryset(qs, 2)
+        
+        self.assertEqual(list(object_list), list(qs[2:4]))
+        self.assertTrue(page.has_previous())
+        
+        from django.http import Http404
+        v.request.GET = {"my_list_page": "invalid!"}
+        
+        self.assertRaises(Http404, v.paginate_queryset, qs, 2)
+     
+    def test_project_list_fields(self):
+        """Tests only the listed and required fields are retrieved.
+        """
+        from django.template import Context
+        from ..templatetags.introspection import render_model_list
+        
+        for i in range(3):
+            User.objects.create(username="user%d" % i, email="user%d@u.it" % i)
+            
+        v = BaseModelListView()
+        v.model = User
+        v.kwargs = {}
+        v.request = FakeRequest()
+        
+        self.assertEqual(v.get_list_only_fields(), None)
+        self.assertEqual(v.get_queryset().query.deferred_loading, (frozenset(), True))
+        
+        v.field_list = ["username", "email"]
+        v.list_required_fields = ["is_active", "groups", "unknown"]
+        qs = v.get_queryset()
+        
+        self.assertEqual(qs.query.deferred_loading, (frozenset(["id", "username", "email", "is_active"]), False))
+        
+        with self.assertNumQueries(1):
+            output = render_model_list(Context(), qs, v.field_list)
+            
+        self.assertEqual(output, render_model_list(Context(), User.objects.all(), v.field_list))
+        
+    def test_paginate_queryset_with_count_strategy(self):
+        """Tests the paginator counts items using the view's count strategy.
+        """
+        for i in range(5):
+            User.objects.create(username="user%d" % i)
+            
+        v = BaseModelListView()
+        v.kwargs = {}
+        v.request = FakeRequest()
+        v.count_strategy = "capped"
+        v.count_limit = 2
+        
+        paginator, page, object_list, is_paginated = v.paginate_queryset(User.objects.order_by("username"), 2)
+        
+        self.assertEqual(paginator.count_strategy, "capped")
+        self.assertFalse(paginator.count_is_exact)
+        self.assertEqual(paginator.display_count, "2+")
+        self.assertTrue(page.has_next())
+     
     def test_get_context_data(self):
         """Tests adding list-related variables to context dict.
         """
@@ -253,6 +332,126 @@ class ModelListDeleteMixinTestCase(TestCase):
         self.assertEqual(response, "get") # NOTE: convenient result just for test.
         self.assertEqual(user_model.objects.count(), 0)
         
+    def test_delete_all_in_chunks(self):
+        """Tests deleting all items in batches.
+        """
+        user_model = get_user_model()
+        for i in range(5):
+            user_model.objects.create(username="u%d" % i)
+        self.m.delete_chunk_size = 2
+        self.request.POST = {"confirm_delete_selected": True, "select_all": True}
+        
+        response = self.m.delete_selected(self.request)
+        
+        self.assertEqual(response, "get")
+        self.assertEqual(user_model.objects.count(), 0)
+        
+    def test_delete_all_in_background(self):
+        """Tests deleting all items with a background job.
+        """
+        from django.http import HttpResponseRedirect
+        
+        user_model = get_user_model()
+        for i in range(5):
+            user_model.objects.create(username="u%d" % i)
+        progress = []
+        
+        def _run_delete_job(func, job_id, *args):
+            # i.e. the arguments are sent to a task queue.
+            import json
+            args = json.loads(json.dumps(args))
+            
+            progress.append(get_delete_job(job_id))
+            func(job_id, *args)
+            progress.append(get_delete_job(job_id))
+        
+        self.m.run_delete_job = _run_delete_job
+        self.m.delete_in_background = True
+        self.m.delete_chunk_size = 2
+        self.request.POST = {"confirm_delete_selected": True, "select_all": True}
+        
+        response = self.m.delete_selected(self.request)
+        
+        self.assertTrue(isinstance(response, HttpResponseRedirect))
+        self.assertTrue(response.url.startswith("/home/test/?delete_job="))
+        self.assertEqual(user_model.objects.count(), 0)
+        for p in progress:
+            self.assertTrue(p.pop("updated"))
+        self.assertEqual(progress, [
+            {"deleted": 0, "total": 5, "done": False, "failed": False},
+            {"deleted": 5, "total": 5, "done": True, "failed": False},
+        ])
+        
+    def test_delete_in_background_requires_runner(self):
+        """Tests deleting in background without a delete job runner.
+        """
+        from django.core.exceptions import ImproperlyConfigured
+        
+        user_model = get_user_model()
+        user_model.objects.create(username="u1")
+        self.m.delete_in_background = True
+        self.request.POST = {"confirm_delete_selected": True, "select_all": True}
+        
+        self.assertRaises(ImproperlyConfigured, self.m.delete_selected, self.request)
+        self.assertEqual(user_model.objects.count(), 1)
+        
+        jobs = []
+        self.m.delete_job_runner = lambda func, *args: jobs.append(args)
+        
+        self.m.delete_selected(self.request)
+        
+        self.assertEqual(len(jobs), 1)
+        
+    def test_stale_delete_job(self):
+        """Tests reporting unfinished jobs no longer updated as failed.
+        """
+        import time
+        from django.core.cache import cache
+        from ..views import _get_delete_job_key, DELETE_JOB_STALE_AFTER
+        
+        progress = {"deleted": 2, "total": 5, "done": False, "failed": False, "updated": time.time()}
+        cache.set(_get_delete_job_key("running"), progress)
+        progress["updated"] -= DELETE_JOB_STALE_AFTER + 1
+        cache.set(_get_delete_job_key("stale"), progress)
+        
+        self.assertFalse(get_delete_job("running")["failed"])
+        self.assertTrue(get_delete_job("stale")["failed"])
+        self.assertTrue(get_delete_job("stale")["done"])
+        self.assertEqual(get_delete_job("missing"), None)
+        
+    def test_redirect_to_last_page_after_deletion(self):
+        """Tests redirecting to the last page only if the current one is gone.
+        """
+        user_model = get_user_model()
+        for i in range(25):
+            user_model.objects.create(username="u%02d" % i)
+        self.m.get_paginate_by = lambda qs: 10
+        
+        # 15 items left: the 2nd page still exists.
+        self.request.GET = {"page": "2"}
+        self.request.POST = {"confirm_delete_selected": True, "select_all": False}
+        for u in user_model.objects.order_by("pk")[:10]:
+            self.request.POST["select_%d" % u.pk] = True
+            
+        self.assertEqual(self.m.delete_selected(self.request), "get")
+        self.assertEqual(user_model.objects.count(), 15)
+        
+        # 5 items left: the 2nd page is gone.
+        self.request.POST = {"confirm_delete_selected": True, "select_all": False}
+        for u in user_model.objects.order_by("pk")[:10]:
+            self.request.POST["select_%d" % u.pk] = True
+            
+        response = self.m.delete_selected(self.request)
+        
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, "/home/test/?page=1")
+        
+        # Lists without pagination.
+        self.m.get_paginate_by = lambda qs: None
+        self.request.POST = {"confirm_delete_selected": True, "select_all": True}
+        
+        self.assertEqual(self.m.delete_selected(self.request), "get")
+        
     def test_delete_selected(self):
         """Tests deleting selected items.
         """
@@ -483,7 +682,209 @@ class ModelListFilteringMixinTestCase(TestCase):
         filter_query = self.m.get_filter_query_from_get()
         
         self.assertEqual(filter_query, {"email__gte": "u2@u.it", "username__lt": "u4", "is_staff": True})
+        
+    def test_reject_expensive_filters(self):
+        """Tests ignoring filters not allowed by the lookup whitelist.
+        """
+        self.m.request.GET = {
+            "filter_by_username__lt": "u4",
+            "filter_by_username__regex": "^u",
+            "filter_by_groups__name": "users",
+        }
+        qs = self.m.get_queryset()
+        
+        self.assertEqual(qs.count(), 3)
+        self.assertEqual(
+            get_list_query_plan(self.m).rejected_filters,
+            {"username__regex": "^u", "groups__name": "users"}
+        )
+        
+        self.m.filter_lookups = {"groups__name": ["exact"]}
+        self.m.request.GET = {"filter_by_groups__name": "users"}
+        qs = self.m.get_queryset()
+        
+        self.assertEqual(get_list_query_plan(self.m).rejected_filters, {})
+        
+    def test_statement_timeout(self):
+        """Tests redirecting without filters when the list query is cancelled.
+        """
+        class FakeBase(object):
+            def get(self, request, *args, **kwargs):
+                raise StatementTimeout("interrupted")
+                
+            def get_list_prefix(self):
+                return ""
+                
+        class TestModelListFilteringMixin(ModelListFilteringMixin, FakeBase):
+            pass
+            
+        m = TestModelListFilteringMixin()
+        m.request = FakeRequest()
+        m.request.GET = {"filter_by_username__icontains": "u"}
+        response = m.get(m.request)
+        
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, "/home/test/")
+        
+        # Without filters, an error page is shown.
+        m.request = FakeRequest()
+        response = m.get(m.request)
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.template_name, "base_list_timeout.html")
+        
+    def test_statement_timeout_while_rendering(self):
+        """Tests cancelling list queries run while rendering the list.
+        """
+        from django.db import connection
+        from django.template import engines
+        from django.template.response import SimpleTemplateResponse
+        
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest("Statement timeouts are not supported.")
+            
+        class FakeBase(object):
+            def get(self, request, *args, **kwargs):
+                return SimpleTemplateResponse(engines['django'].from_string("{{ list_filter_choices }}"), self.get_context_data())
+                
+            def get_queryset(self):
+                return get_user_model().objects.all()
+                
+            def get_context_data(self, *args, **kwargs):
+                return {}
+                
+            def get_list_prefix(self):
+                return ""
+                
+        class TestModelListFilteringMixin(ModelListFilteringMixin, FakeBase):
+            list_statement_timeout = 10
+            
+            def get_filter_choices(self, queryset):
+                # i.e. a slow query on a big list.
+                with connection.cursor() as cursor:
+                    cursor.execute("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM (SELECT x FROM c LIMIT 100000000) AS t")
+                    return cursor.fetchone()[0]
+            
+        m = TestModelListFilteringMixin()
+        m.request = FakeRequest()
+        m.request.GET = {"filter_by_username__icontains": "u"}
+        response = m.get(m.request)
+        
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, "/home/test/")
 
+class ModelListFilterChoicesTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        
+        class FakeBase(object):
+            def get(self, request, *args, **kwargs):
+                return "get"
+                
+            def get_queryset(self):
+                return ObjectPermission.objects.all()
+                
+            def get_list_prefix(self):
+                return ""
+                
+            def get_field_list(self):
+                return ["perm", "object_id"]
+                
+            def get_context_data(self):
+                return {}
+                
+        class TestModelListFilteringMixin(ModelListFilteringMixin, FakeBase):
+            pass
+            
+        cache.clear()
+        self.m = TestModelListFilteringMixin()
+        self.m.request = FakeRequest()
+        ObjectPermission.objects.all().delete()
+        self.op1, n = ObjectPermission.objects.get_or_create_by_uid("%s.view_user.1" % auth_app)
+        self.op2, n = ObjectPermission.objects.get_or_create_by_uid("%s.view_user.2" % auth_app)
+        self.op3, n = ObjectPermission.objects.get_or_create_by_uid("%s.change_user.1" % auth_app)
+        
+    def tearDown(self):
+        from django.core.cache import cache
+        cache.clear()
+        
+    def test_filter_choices(self):
+        """Tests FK filter choices are the distinct referenced objects.
+        """
+        context = self.m.get_context_data()
+        
+        with self.assertNumQueries(1):
+            choices = context['list_filter_choices']["perm_id"]
+            
+        self.assertFalse(choices["autocomplete"])
+        self.assertEqual(
+            sorted(choices["choices"]),
+            sorted([(self.op1.perm.pk, "%s" % self.op1.perm), (self.op3.perm.pk, "%s" % self.op3.perm)])
+        )
+        
+        # Choices are cached.
+        context = self.m.get_context_data()
+        
+        with self.assertNumQueries(0):
+            self.assertEqual(context['list_filter_choices']["perm_id"], choices)
+            
+        # Only the given relations are loaded together with the choices.
+        field = ObjectPermission._meta.get_field("perm")
+        
+        self.assertEqual(self.m._get_related_in_list(field, ObjectPermission.objects.all()).query.select_related, {"content_type": {}})
+        
+        self.m.filter_choices_related = {"perm_id": []}
+        
+        self.assertFalse(self.m._get_related_in_list(field, ObjectPermission.objects.all()).query.select_related)
+        
+        self.m.filter_choices_related = None
+        
+        # Labels are translated: choices are cached per language.
+        from django.utils import translation
+        
+        with translation.override("it"):
+            context = self.m.get_context_data()
+            
+            with self.assertNumQueries(1):
+                context['list_filter_choices']["perm_id"]
+            
+    def test_autocomplete_filter(self):
+        """Tests too many FK filter choices switch to autocomplete.
+        """
+        import json
+        
+        self.m.filter_choices_limit = 1
+        context = self.m.get_context_data()
+        
+        self.assertEqual(context['list_filter_choices']["perm_id"], {"choices": [], "autocomplete": True})
+        
+        self.m.request.GET = {"autocomplete": "perm_id", "term": "change"}
+        response = self.m.get(self.m.request)
+        
+        # Permissions have no indexed CharField to match.
+        self.assertEqual(json.loads(response.content.decode("utf-8")), [])
+        
+        self.m.autocomplete_search_fields = {"perm_id": ["codename"]}
+        response = self.m.get(self.m.request)
+        
+        self.assertEqual(json.loads(response.content.decode("utf-8")), [{"value": self.op3.perm.pk, "label": "%s" % self.op3.perm}])
+        
+        # Too short terms are not matched.
+        self.m.request.GET = {"autocomplete": "perm_id", "term": "ch"}
+        response = self.m.get(self.m.request)
+        
+        self.assertEqual(json.loads(response.content.decode("utf-8")), [])
+        
+        self.m.request.GET = {"autocomplete": "perm_id", "term": "%d" % self.op3.perm.pk}
+        response = self.m.get(self.m.request)
+        
+        self.assertEqual(json.loads(response.content.decode("utf-8")), [{"value": self.op3.perm.pk, "label": "%s" % self.op3.perm}])
+        
+        self.m.request.GET = {"autocomplete": "object_id"}
+        
+        from django.http import Http404
+        self.assertRaises(Http404, self.m.get, self.m.request)
+        
 class ModelListOrderingMixinTestCase(TestCase):
     def setUp(self):
         user_model = get_user_model()
@@ -574,6 +975,164 @@ class ModelListOrderingMixinTestCase(TestCase):
         self.assertTrue("list_order_by" in context)
         self.assertEqual(context['list_order_by'], "email")
         
+class ModelListQueryPlanTestCase(TestCase):
+    def setUp(self):
+        self.calls = []
+        calls = self.calls
+        
+        class TestModelListView(ModelListView):
+            model = User
+            paginate_by = 2
+            template_name = "elements/empty.html"
+            
+            def get_queryset(self):
+                calls.append(1)
+                return super(TestModelListView, self).get_queryset()
+                
+        for i in range(5):
+            User.objects.create(username="u%d" % i, email="u%d@u.it" % (i % 2))
+            
+        self.v = TestModelListView()
+        self.v.args = ()
+        self.v.kwargs = {}
+        self.v.request = FakeRequest()
+        self.v.request.GET = {"filter_by_email": "u0@u.it", "order_by": "-username", "page": 2}
+        
+    def test_parse_request_once(self):
+        """Tests the list query plan is parsed once and shared by all mixins.
+        """
+        plan = get_list_query_plan(self.v)
+        
+        self.assertEqual(plan.filter_query, {"email": "u0@u.it"})
+        self.assertEqual(plan.order_by, "-username")
+        self.assertEqual(plan.page, 2)
+        self.assertTrue(get_list_query_plan(self.v) is plan)
+        
+        self.v.request.GET = {}
+        
+        self.assertFalse(get_list_query_plan(self.v) is plan)
+        
+    def test_build_queryset_once(self):
+        """Tests the list queryset is built only once per request.
+        """
+        response = self.v.get(self.v.request)
+        context = response.context_data
+        
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([u.username for u in context['object_list']], ["u0"])
+        self.assertEqual(context['list_order_by'], "-username")
+        self.assertEqual(context['list_filter_by'], {"email": ("email", "u0@u.it")})
+        self.assertEqual(context['unfiltered_object_list'].count(), User.objects.count())
+        
+class ModelListExportMixinTestCase(TestCase):
+    def setUp(self):
+        class TestModelListView(ModelListView):
+            model = User
+            field_list = ["username", "email", "groups"]
+            
+        # Users are added to the "users" group by default.
+        for i in range(5):
+            User.objects.create(username="u%d" % i, email="u%d@u.it" % (i % 2))
+            
+        self.v = TestModelListView()
+        self.v.args = ()
+        self.v.kwargs = {}
+        self.v.request = FakeRequest()
+        
+    def export(self, GET):
+        self.v.request.GET = GET
+        response = self.v.get(self.v.request)
+        return response, b"".join(response.streaming_content).decode("utf-8")
+        
+    def test_export_csv(self):
+        """Tests exporting filtered and ordered items as CSV.
+        """
+        response, content = self.export({"filter_by_email": "u0@u.it", "order_by": "-username", "page": 2, "export": "csv"})
+        
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="users.csv"')
+        self.assertEqual(
+            content.splitlines(),
+            ["username,email,groups", "u4,u0@u.it,[<Group: users>]", "u2,u0@u.it,[<Group: users>]", "u0,u0@u.it,[<Group: users>]"]
+        )
+        
+    def test_export_jsonl(self):
+        """Tests exporting items as JSON Lines.
+        """
+        import json
+        
+        response, content = self.export({"filter_by_username": "u1", "export": "jsonl"})
+        
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        self.assertEqual([json.loads(l) for l in content.splitlines()], [{"username": "u1", "email": "u1@u.it", "groups": ["users"]}])
+        
+    def test_export_skips_non_field_columns(self):
+        """Tests columns which aren't model fields are not exported.
+        """
+        self.v.field_list = ["username", "get_full_name", "email"]
+        
+        response, content = self.export({"filter_by_username": "u1", "export": "csv"})
+        
+        self.assertEqual(content.splitlines(), ["username,email", "u1,u1@u.it"])
+        
+    def test_export_in_chunks(self):
+        """Tests items are retrieved and prefetched chunk by chunk.
+        """
+        self.v.export_chunk_size = 2
+        self.v.request.GET = {"filter_by_username__startswith": "u", "export": "csv"}
+        response = self.v.get(self.v.request)
+        
+        # One query for the items, plus one per chunk to prefetch the groups.
+        with self.assertNumQueries(4):
+            self.assertEqual(len(list(response.streaming_content)), 6)
+        
+    def test_unknown_export_format(self):
+        """Tests an unknown export format is refused.
+        """
+        from django.http import Http404
+        
+        self.v.request.GET = {"export": "xls"}
+        
+        self.assertRaises(Http404, self.v.get, self.v.request)
+        
+class ModelListPermissionMixinTestCase(TestCase):
+    def setUp(self):
+        user_model = get_user_model()
+        
+        class FakeBase():
+            def get_queryset(self):
+                return user_model.objects.all()
+                
+        class TestModelListPermissionMixin(ModelListPermissionMixin, FakeBase):
+            pass
+            
+        self.m = TestModelListPermissionMixin()
+        self.m.request = FakeRequest()
+        self.u1 = user_model.objects.create(username="u1")
+        self.u2 = user_model.objects.create(username="u2")
+        self.m.request.user = self.u1
+        
+    def test_get_list_perm(self):
+        """Tests retrieving the list permission.
+        """
+        self.assertEqual(self.m.list_perm, None)
+        self.assertEqual(self.m.get_list_perm(), self.m.list_perm)
+        
+    def test_get_queryset(self):
+        """Tests returning only permitted items.
+        """
+        user_model = get_user_model()
+        
+        self.assertEqual(self.m.get_queryset().count(), 2)
+        
+        self.m.list_perm = "core.view_user"
+        
+        self.assertQuerysetEqual(
+            self.m.get_queryset(),
+            [repr(self.u1)],
+            ordered=False
+        )
+        
 class DetailUserViewTestCase(TestCase):
     def setUp(self):
         self.u1 = get_user_model().objects.create_user("u1", "u@u.it", "password")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""This file is part of the django ERP project.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
+__version__ = '0.0.5'
+
+
+import time
+from contextlib import contextmanager
+from django.db import connections, DatabaseError, OperationalError, DEFAULT_DB_ALIAS
+
+
+class StatementTimeout(DatabaseError):
+    pass
+
+
+@contextmanager
+def statement_timeout(timeout, using=DEFAULT_DB_ALIAS):
+    """Cancels the queries run in this block which last more than timeout ms.
+    
+    The timeout applies to each query on its own, not to the whole block. A
+    cancelled query raises a StatementTimeout error. It's implemented with
+    "statement_timeout" on PostgreSQL and with a progress handler on SQLite.
+    On other databases (or without a timeout) queries are not cancelled.
+
+    Example usage:
+
+        with statement_timeout(5000):
+            list(queryset)
+    """
+    connection = connections[using]
+    
+    if not timeout or connection.vendor not in ("postgresql", "sqlite"):
+        yield
+        return
+        
+    failed = []
+    deadline = [None]
+    
+    def _execute_wrapper(execute, sql, params, many, context):
+        # Each query gets the whole timeout.
+        deadline[0] = time.monotonic() + timeout / 1000.0
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError:
+            failed.append(True)
+            raise
+            
+    def _is_cancelled(e):
+        if connection.vendor == "postgresql":
+            # 57014: query_canceled.
+            return getattr(e.__cause__, "pgcode", None) == "57014"
+        return deadline[0] is not None and time.monotonic() > deadline[0]
+        
+    connection.ensure_connection()
+    
+    if connection.vendor == "postgresql":
+        # SET LOCAL doesn't outlive the current transaction (if any).
+        set_sql = "SET LOCAL statement_timeout = %s" if connection.in_atomic_block else "SET statement_timeout = %s"
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW statement_timeout")
+            previous = cursor.fetchone()[0]
+            cursor.execute(set_sql, [int(timeout)])
+    else:
+        def _progress_handler():
+            return int(deadline[0] is not None and time.monotonic() > deadline[0])
+            
+        connection.connection.set_progress_handler(_progress_handler, 1000)
+        
+    try:
+        with connection.execute_wrapper(_execute_wrapper):
+            yield
+    except OperationalError as e:
+        if _is_cancelled(e):
+            raise StatementTimeout(e)
+        raise
+    finally:
+        if connection.vendor == "postgresql":
+            # A failed query breaks the current transaction, whose rollback
+            # restores the previous timeout anyway.
+            if not (failed and connection.in_atomic_block):
+                with connection.cursor() as cursor:
+                    cursor.execute(set_sql, [previous])
+        elif connection.connection is not None:
+            connection.connection.set_progress_handler(None, 0)
@@ -19,7 +19,7 @@ from django.utils.formats import localize
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from django.apps import apps as app_registry
-from django.db import models
+from django.db import models, transaction
 from django import forms
 from django.forms.boundfield import BoundField
 from django.forms.utils import flatatt, pretty_name
@@ -55,6 +55,39 @@ def get_model(klass):
     raise ValueError
    
      
+_field_maps = {}
+
+def get_field_map(model, by_attname=False):
+    """Returns a dict containing all the fields of the given model class.
+    
+    The dict is built once per model class and shared by all callers, so it
+    must not be changed. It's rebuilt only when the model options are reset
+    (i.e. when the app registry is reloaded).
+    
+    The returned dict is in the form:
+    
+    {field_name: field_instance, ...}
+    
+    or, if by_attname is True, it contains only the concrete fields:
+    
+    {field_attname: field_instance, ...}
+    """
+    opts = model._meta
+    fields, many_to_many = opts.fields, opts.many_to_many
+    try:
+        cached_fields, cached_many_to_many, field_map = _field_maps[(model, by_attname)]
+        if cached_fields is fields and cached_many_to_many is many_to_many:
+            return field_map
+    except KeyError:
+        pass
+    if by_attname:
+        field_map = dict([(f.attname, f) for f in fields])
+    else:
+        field_map = dict([(f.name, f) for f in (fields + many_to_many)])
+    _field_maps[(model, by_attname)] = (fields, many_to_many, field_map)
+    return field_map
+
+
 def get_fields(form_or_model):
     """Returns a dict containing all the fields of the given model/form instance.
     
@@ -67,13 +100,127 @@ def get_fields(form_or_model):
     field_list = {}
     
     if isinstance(form_or_model, models.Model):
-        field_list = dict([(f.name, f) for f in (form_or_model._meta.fields + form_or_model._meta.many_to_many)])
+        field_list = get_field_map(form_or_model.__class__)
     elif isinstance(form_or_model, forms.BaseForm):
         field_list = form_or_model.fields
         
     return field_list
 
 
+def get_related_lookups(fields):
+    """Returns the prefetch_related lookups needed to render the given fields
+    in a list.
+    
+    Only ManyToManyFields need their related objects: ForeignKey and
+    OneToOneField cells show the raw key stored in the row.
+    """
+    return [f.name for f in fields if f.many_to_many]
+
+
+def delete_in_chunks(queryset, chunk_size=500, callback=None):
+    """Deletes all the objects of the given queryset, in batches of chunk_size.
+    
+    Each batch is deleted in its own transaction, so cascades and signals
+    never collect more than chunk_size objects at once. If a callback is
+    given, it's called after each batch with the number of objects deleted
+    so far.
+    
+    Returns the number of deleted objects (not including cascades).
+    """
+    pk_list = queryset.order_by('pk').values_list('pk', flat=True)
+    manager = queryset.model._base_manager.db_manager(queryset.db)
+    deleted = 0
+    last_pk = None
+    
+    while True:
+        chunk_pk_list = pk_list if last_pk is None else pk_list.filter(pk__gt=last_pk)
+        pks = list(chunk_pk_list[:chunk_size])
+        if not pks:
+            break
+        with transaction.atomic(using=queryset.db):
+            manager.filter(pk__in=pks).delete()
+        deleted += len(pks)
+        last_pk = pks[-1]
+        if callback:
+            callback(deleted)
+            
+    return deleted
+
+
+def get_aggregates(queryset, fields):
+    """Returns per-field aggregates over the whole given queryset.
+    
+    Numeric fields are summed and averaged, date/time fields get their min
+    and max values, while boolean and choice fields get the count of each
+    value (facets). Sums, averages and min/max values are computed by a
+    single query, facets by a single "GROUP BY" query per field.
+    
+    The returned list is aligned with the given fields, in the form:
+    
+    [{"aggregates": [(label, value), ...], "facets": [(label, count), ...]}, ...]
+    """
+    numeric_types = (models.IntegerField, models.FloatField, models.DecimalField)
+    date_types = (models.DateField, models.TimeField)
+    expressions = {}
+    results = []
+    
+    if queryset.query.is_sliced:
+        # Values can't be grouped within a slice.
+        queryset = queryset.model._base_manager.db_manager(queryset.db).filter(pk__in=queryset.values('pk'))
+    queryset = queryset.order_by()
+    
+    for i, f in enumerate(fields):
+        aggregates = []
+        facets = []
+        if not f.concrete or f.is_relation or f.primary_key:
+            pass
+        elif f.choices or isinstance(f, models.BooleanField):
+            if f.choices:
+                values = list(f.flatchoices)
+            else:
+                values = [(True, _("Yes")), (False, _("No"))]
+                if f.null:
+                    values.append((None, _("Empty")))
+            counts = dict(queryset.values_list(f.attname).annotate(count=models.Count('pk')))
+            facets = [(label, counts.get(value, 0)) for value, label in values]
+        elif isinstance(f, numeric_types):
+            aggregates = [(_("Sum"), "f%d_sum" % i), (_("Average"), "f%d_avg" % i)]
+            expressions["f%d_sum" % i] = models.Sum(f.attname)
+            expressions["f%d_avg" % i] = models.Avg(f.attname)
+        elif isinstance(f, date_types):
+            aggregates = [(_("Min"), "f%d_min" % i), (_("Max"), "f%d_max" % i)]
+            expressions["f%d_min" % i] = models.Min(f.attname)
+            expressions["f%d_max" % i] = models.Max(f.attname)
+        results.append((aggregates, facets))
+        
+    values = queryset.aggregate(**expressions) if expressions else {}
+    
+    return [
+        {
+            "aggregates": [(label, values[key]) for label, key in aggregates],
+            "facets": facets,
+        }
+        for aggregates, facets in results
+    ]
+
+
+def get_filter_lookups(f):
+    """Returns the lookups that could be used by default to filter on field f.
+    
+    Relations could be only matched by key, while TextFields (usually large
+    and not indexed) can't be scanned by pattern.
+    """
+    if f.is_relation:
+        return ("exact", "isnull")
+    elif f.choices or isinstance(f, models.BooleanField):
+        return ("exact", "iexact", "isnull")
+    elif isinstance(f, models.TextField):
+        return ("exact", "iexact", "isnull")
+    elif isinstance(f, models.CharField):
+        return ("exact", "iexact", "gt", "gte", "lt", "lte", "icontains", "istartswith", "iendswith", "isnull")
+    return ("exact", "iexact", "gt", "gte", "lt", "lte", "isnull")
+
+
 def get_field_type(f):
     """Returns a string representing the type of the given field.
     """
@@ -83,10 +230,12 @@ def get_field_type(f):
     return field_type
 
        
-def get_field_tuple(name, form_or_model):
+def get_field_tuple(name, form_or_model, field_list=None):
     """Returns a tuple for the field, of given instance, identified by "name".
     
     Instance could be a model instance, a form instance or any arbitrary object.
+    The dict of its fields (as returned by "get_fields") could be passed as
+    "field_list", to not build it again for each field.
     
     The returned tuple is in the form:
     
@@ -97,7 +246,8 @@ def get_field_tuple(name, form_or_model):
     label = ""
     value = ""
     td_attrs = {}
-    field_list = get_fields(form_or_model)
+    if field_list is None:
+        field_list = get_fields(form_or_model)
     field = None
     
     if name in field_list:
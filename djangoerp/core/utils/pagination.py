@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+"""This file is part of the django ERP project.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
+__version__ = '0.0.5'
+
+
+import datetime
+import json
+from hashlib import md5
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist, EmptyResultSet, ValidationError
+from django.core.paginator import Paginator, EmptyPage, InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, DatabaseError
+from django.db.models import F, Q, QuerySet
+from django.utils.functional import cached_property
+
+
+class CountingPaginator(Paginator):
+    """A paginator which counts its objects using a pluggable strategy.
+
+    Available count strategies are:
+
+     * exact -- A plain "COUNT(*)" query (Django's default).
+     * cached -- An exact count, cached for "count_timeout" seconds and keyed
+                 by the SQL of the (filtered) query.
+     * estimated -- The row estimate of the database planner (PostgreSQL) or
+                    the table statistics (SQLite, unfiltered queries only),
+                    falling back to "capped" when no estimate is available.
+     * capped -- Counts at most "count_limit" rows (i.e. "1000+").
+
+    When the count isn't exact, pages beyond the counted ones are still
+    reachable and "display_count" is marked as approximate.
+    """
+    COUNT_STRATEGIES = ("exact", "cached", "estimated", "capped")
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, count_strategy="exact", count_limit=1000, count_timeout=300):
+        super(CountingPaginator, self).__init__(object_list, per_page, orphans, allow_empty_first_page)
+        if count_strategy not in self.COUNT_STRATEGIES:
+            raise ValueError("Invalid count strategy: %s" % count_strategy)
+        self.count_strategy = count_strategy
+        self.count_limit = int(count_limit)
+        self.count_timeout = count_timeout
+        self.count_is_exact = True
+        self.count_is_estimated = False
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super(CountingPaginator, self).count
+        return getattr(self, "_count_%s" % self.count_strategy)(self.object_list)
+
+    @property
+    def display_count(self):
+        if self.count_is_estimated:
+            return "~%d" % self.count
+        if not self.count_is_exact:
+            return "%d+" % (self.count - 1)
+        return "%d" % self.count
+
+    def validate_number(self, number):
+        try:
+            return super(CountingPaginator, self).validate_number(number)
+        except EmptyPage:
+            if self.count_is_exact or int(number) < 1:
+                raise
+        # The count is only a lower bound: count far enough to reach the page.
+        self._recount((int(number) + 1) * self.per_page)
+        return super(CountingPaginator, self).validate_number(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_exact and number >= self.num_pages:
+            self._recount((number + 1) * self.per_page)
+        return super(CountingPaginator, self).page(number)
+
+    def _recount(self, limit):
+        self.count_limit = max(self.count_limit, limit)
+        self.count_is_exact = True
+        self.count_is_estimated = False
+        self.__dict__.pop('num_pages', None)
+        self.__dict__['count'] = self._count_capped(self.object_list)
+
+    def _count_exact(self, queryset):
+        return queryset.count()
+
+    def _count_cached(self, queryset):
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        key = "djangoerp.count.%s.%s" % (queryset.db, md5(("%s|%r" % (sql, params)).encode("utf-8")).hexdigest())
+        cache = caches[getattr(settings, 'LIST_COUNT_CACHE_ALIAS', 'default')]
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_timeout)
+        return count
+
+    def _count_capped(self, queryset):
+        count = queryset.order_by()[:self.count_limit + 1].count()
+        if count > self.count_limit:
+            self.count_is_exact = False
+        return count
+
+    def _count_estimated(self, queryset):
+        connection = connections[queryset.db]
+        query = queryset.query
+        estimate = None
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == "postgresql":
+                    sql, params = queryset.order_by().query.sql_with_params()
+                    cursor.execute("EXPLAIN (FORMAT JSON) %s" % sql, params)
+                    plan = cursor.fetchone()[0]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    estimate = int(plan[0]["Plan"]["Plan Rows"])
+                elif connection.vendor == "sqlite" and not query.where and not query.distinct and not query.combinator:
+                    cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [queryset.model._meta.db_table])
+                    row = cursor.fetchone()
+                    if row:
+                        estimate = int(row[0].split()[0])
+        except EmptyResultSet:
+            return 0
+        except (DatabaseError, ValueError, LookupError, TypeError):
+            estimate = None
+        if estimate is None:
+            return self._count_capped(queryset)
+        self.count_is_exact = False
+        self.count_is_estimated = True
+        return estimate
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """JSON encoder which keeps the microseconds of datetimes and times.
+
+    Cursor values must match the stored ones exactly, while DjangoJSONEncoder
+    truncates them to milliseconds (as ECMA-262 does).
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(CursorJSONEncoder, self).default(o)
+
+class KeysetPage(object):
+    """A page of a keyset paginated queryset.
+
+    It exposes the same interface of Django's Page class used by templates,
+    but "previous_page_number" and "next_page_number" return opaque cursors.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, previous_cursor=None, next_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def __repr__(self):
+        return '<Keyset page of %d items>' % len(self)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return list(self.object_list)[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        return self.next_cursor
+
+    def previous_page_number(self):
+        return self.previous_cursor
+
+class KeysetPaginator(object):
+    """Paginates a queryset seeking from the last (or first) row of a page.
+
+    Each page is retrieved by a single query filtering on the ordering fields
+    of the queryset (always completed by the primary key, as tie-breaker), so
+    its cost doesn't depend on how deep the page is. Rows are never counted.
+
+    Pages are identified by opaque cursors: an invalid (or tampered) cursor
+    raises InvalidPage.
+
+    NULL values of nullable ordering fields are sorted as the greatest ones
+    (last in ascending order, first in descending order) on every database.
+    """
+    count = None
+    num_pages = None
+
+    def __init__(self, queryset, per_page):
+        self.per_page = int(per_page)
+        self.model = queryset.model
+        self.ordering = self._get_ordering(queryset)
+        self.nullable = [self._is_nullable(name) for name, desc in self.ordering]
+        self.queryset = queryset.order_by(*[self._get_order_by(name, desc, nullable) for (name, desc), nullable in zip(self.ordering, self.nullable)])
+        
+    @property
+    def object_list(self):
+        return self.queryset
+
+    def _get_ordering(self, queryset):
+        """Returns the list of (field name, descending) tuples for queryset.
+        """
+        opts = queryset.model._meta
+        if queryset.query.order_by:
+            order_by = queryset.query.order_by
+        elif queryset.query.default_ordering:
+            order_by = opts.ordering
+        else:
+            order_by = []
+        ordering = []
+        for name in order_by:
+            if not isinstance(name, str) or name == "?":
+                continue
+            desc = name.startswith("-")
+            name = name.lstrip("-+")
+            if name in ("pk", opts.pk.name, opts.pk.attname):
+                ordering.append(("pk", desc))
+                return ordering
+            try:
+                # Relations are sorted (and compared) by their keys.
+                name = opts.get_field(name).attname
+            except FieldDoesNotExist:
+                pass
+            ordering.append((name, desc))
+        ordering.append(("pk", False))
+        return ordering
+
+    def _get_field(self, name):
+        """Returns the model field identified by the ordering name (or None).
+        """
+        opts = self.queryset.model._meta
+        if name == "pk":
+            return opts.pk
+        field = None
+        for attr in name.split("__"):
+            try:
+                field = opts.get_field(attr)
+            except FieldDoesNotExist:
+                return None
+            if field.is_relation and field.related_model:
+                opts = field.related_model._meta
+        return field
+
+    def _is_nullable(self, name):
+        """Returns False only if the ordering name can't be NULL.
+        """
+        opts = self.model._meta
+        if name == "pk":
+            return False
+        for attr in name.split("__"):
+            try:
+                field = opts.get_field(attr)
+            except FieldDoesNotExist:
+                return True
+            if field.null or (field.is_relation and not field.concrete):
+                return True
+            if field.is_relation and field.related_model:
+                opts = field.related_model._meta
+        return False
+
+    def _get_order_by(self, name, desc, nullable):
+        if not nullable:
+            return "%s%s" % ("-" if desc else "", name)
+        if desc:
+            return F(name).desc(nulls_first=True)
+        return F(name).asc(nulls_last=True)
+
+    def _to_python(self, name, value):
+        field = self._get_field(name)
+        if field is None:
+            return value
+        if field.is_relation:
+            # Relations are compared by their keys.
+            field = field.target_field
+        return field.to_python(value)
+
+    def _get_value(self, obj, name):
+        if name == "pk":
+            return obj.pk
+        for attr in name.split("__"):
+            if obj is None:
+                break
+            obj = getattr(obj, attr)
+        return obj
+
+    def encode_cursor(self, obj, backward=False):
+        values = [self._get_value(obj, name) for name, desc in self.ordering]
+        data = json.dumps(["p" if backward else "n", values], cls=CursorJSONEncoder)
+        return urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """Returns (backward, values) or raises InvalidPage if cursor isn't valid.
+
+        Values are converted to the types of the ordering fields.
+        """
+        try:
+            cursor = str(cursor)
+            data = urlsafe_b64decode((cursor + "=" * (-len(cursor) % 4)).encode("ascii"))
+            direction, values = json.loads(data.decode("utf-8"))
+            if direction in ("n", "p") and isinstance(values, list) and len(values) == len(self.ordering):
+                if all(value is not None or nullable for value, nullable in zip(values, self.nullable)):
+                    return direction == "p", [value if value is None else self._to_python(name, value) for (name, desc), value in zip(self.ordering, values)]
+        except (TypeError, ValueError, UnicodeError, ValidationError):
+            pass
+        raise InvalidPage("Invalid cursor: %s" % cursor)
+
+    def _get_seek_filter(self, values, backward=False):
+        q = Q()
+        for i, (name, desc) in enumerate(self.ordering):
+            value, nullable = values[i], self.nullable[i]
+            # NULLs are the greatest values.
+            if desc != backward:
+                if value is None:
+                    seek = Q(**{"%s__isnull" % name: False})
+                else:
+                    seek = Q(**{"%s__lt" % name: value})
+            else:
+                if value is None:
+                    # Nothing is greater than NULL.
+                    continue
+                seek = Q(**{"%s__gt" % name: value})
+                if nullable:
+                    seek |= Q(**{"%s__isnull" % name: True})
+            for j in range(i):
+                if values[j] is None:
+                    seek &= Q(**{"%s__isnull" % self.ordering[j][0]: True})
+                else:
+                    seek &= Q(**{self.ordering[j][0]: values[j]})
+            q |= seek
+        return q
+
+    def page(self, cursor=None):
+        """Returns the page identified by cursor (the first one if empty).
+        """
+        position = self.decode_cursor(cursor) if cursor else None
+        queryset = self.queryset
+        backward = False
+
+        if position:
+            backward, values = position
+            queryset = queryset.filter(self._get_seek_filter(values, backward))
+            if backward:
+                queryset = queryset.reverse()
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backward:
+            rows.reverse()
+
+        previous_cursor = next_cursor = None
+        if rows:
+            if (backward and has_more) or (not backward and position):
+                previous_cursor = self.encode_cursor(rows[0], True)
+            if backward or has_more:
+                next_cursor = self.encode_cursor(rows[-1])
+
+        return KeysetPage(rows, self, previous_cursor, next_cursor)
@@ -15,16 +15,64 @@ __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
 
+import re
+from functools import lru_cache
+from operator import methodcaller
 from django.utils.formats import localize
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from django.template.loader import render_to_string
 from django.db import models
 
+from ..cache import TemplateFragmentCache
+
+
+_LAYOUT_TOKEN = re.compile(r"""\s*(?:(\[)|(\])|(,)|'([^']*)'|"([^"]*)"|([^,\[\]'"]+))""")
+
+@lru_cache(maxsize=256)
+def parse_layout(layout):
+    """Parses a layout string in nested tuples of names.
+    
+    Names could be quoted or not, lists could be nested. The parsed layouts
+    are cached, so each string is parsed only once.
+
+    Example usage:
+
+        >> parse_layout("[field1, [0.field2, '1.field3:(suffix)'], field4]")
+        ('field1', ('0.field2', '1.field3:(suffix)'), 'field4')
+        >> parse_layout("object")
+        ('object',)
+    """
+    stack = [[]]
+    pos = 0
+    layout = layout.strip()
+    while pos < len(layout):
+        m = _LAYOUT_TOKEN.match(layout, pos)
+        if not m:
+            raise ValueError("Invalid layout: %s" % layout)
+        pos = m.end()
+        open_list, close_list, comma, single_quoted, double_quoted, name = m.groups()
+        if open_list:
+            stack.append([])
+        elif close_list:
+            if len(stack) < 2:
+                raise ValueError("Unbalanced layout: %s" % layout)
+            items = tuple(stack.pop())
+            stack[-1].append(items)
+        elif not comma:
+            name = single_quoted if single_quoted is not None else double_quoted if double_quoted is not None else name.strip()
+            stack[-1].append(name)
+    if len(stack) != 1:
+        raise ValueError("Unbalanced layout: %s" % layout)
+    items = stack[0]
+    if layout.startswith("[") and len(items) == 1:
+        return items[0]
+    return tuple(items)
 
 def value_to_string(value):
     """Tries to return a smart string representation of the given value.
     """
+    fragments = TemplateFragmentCache()
     output = localize(value)
 
     if isinstance(value, (list, tuple)):
@@ -32,9 +80,9 @@ def value_to_string(value):
 
     elif isinstance(value, bool):
         if value:
-            output = render_to_string('elements/yes.html', {})
+            output = fragments.get('elements/yes.html')
         else:
-            output = render_to_string('elements/no.html', {})
+            output = fragments.get('elements/no.html')
 
     elif isinstance(value, float):
         output = '%.2f' % value
@@ -43,51 +91,113 @@ def value_to_string(value):
         output = '%d' % value
 
     if not value and not output:
-        output = render_to_string('elements/empty.html', {})
+        output = fragments.get('elements/empty.html')
 
     return mark_safe(output.strip())
 
-def field_to_value(field, instance):
-    """Tries to convert a model field value in something smarter to render.
+@lru_cache(maxsize=None)
+def get_value_formatter(field):
+    """Returns a function converting the value of field, in a given model
+    instance, in something smarter to render.
+    
+    The kind of conversion is resolved only once per field: the returned
+    function does just the per-value work.
     """
-    value = getattr(instance, field.name)
+    name = field.name
+    
+    if field.choices:
+        get_display = methodcaller('get_%s_display' % name)
+        fallback = lambda instance, value: get_display(instance)
+        
+    elif isinstance(field, models.BooleanField):
+        fallback = lambda instance, value: not (value == '0' or not value)
+        
+    else:
+        fallback = lambda instance, value: value
 
     if field.primary_key or isinstance(field, (models.SlugField, models.PositiveIntegerField)):
-        if value:
-          return '#%s' % value
-
-    elif isinstance(field, (models.ForeignKey, models.OneToOneField)):
-        try:
-            return render_to_string('elements/link.html', {'url': value.get_absolute_url(), 'caption': value})
-        except AttributeError:
+        def formatter(instance):
+            value = getattr(instance, name)
+            if value:
+                return '#%s' % value
             return value
 
-    elif isinstance(field, models.ManyToManyField):
-        items = []
-        for item in value.all():
+    elif isinstance(field, (models.ForeignKey, models.OneToOneField)):
+        def formatter(instance):
+            value = getattr(instance, name)
             try:
-                items.append(render_to_string('elements/link.html', {'url': item.get_absolute_url(), 'caption': item}))
+                return render_to_string('elements/link.html', {'url': value.get_absolute_url(), 'caption': value})
             except AttributeError:
-                items.append('%s' % item)
-        return items
+                return value
 
-    elif isinstance(field, models.URLField) and value:
-        return render_to_string('elements/link.html', {'url': value, 'caption': value})
+    elif isinstance(field, models.ManyToManyField):
+        def formatter(instance):
+            items = []
+            for item in getattr(instance, name).all():
+                try:
+                    items.append(render_to_string('elements/link.html', {'url': item.get_absolute_url(), 'caption': item}))
+                except AttributeError:
+                    items.append('%s' % item)
+            return items
+
+    elif isinstance(field, (models.URLField, models.EmailField)):
+        scheme = 'mailto:' if isinstance(field, models.EmailField) else ''
+        def formatter(instance):
+            value = getattr(instance, name)
+            if value:
+                return render_to_string('elements/link.html', {'url': '%s%s' % (scheme, value), 'caption': value})
+            return fallback(instance, value)
+
+    else:
+        def formatter(instance):
+            return fallback(instance, getattr(instance, name))
+
+    return formatter
+
+@lru_cache(maxsize=None)
+def get_cell_formatter(field):
+    """Returns a function converting the value of field, in a given model
+    instance, in the plain string shown in a list.
+    
+    ForeignKey and OneToOneField cells show the raw key, which is stored in
+    the row itself (no related object is loaded).
+    """
+    return field.value_to_string
 
-    elif isinstance(field, models.EmailField) and value:
-        return render_to_string('elements/link.html', {'url': 'mailto:%s' % value, 'caption': value})
+@lru_cache(maxsize=256)
+def get_row_renderer(model, field_names=()):
+    """Returns a function converting a model instance in a list row.
+    
+    The row is the list of the plain strings of the fields identified by
+    field_names (a tuple) [default: all]. Fields and their formatters are
+    resolved once per (model, field_names).
 
-    elif field.choices:
-        return getattr(instance, 'get_%s_display' % field.name)()
+    Example usage:
 
-    elif isinstance(field, models.BooleanField):
-        if value == '0' or not value:
-            return False
-        return True
+        render_row = get_row_renderer(User, ("username", "email"))
+        rows = [render_row(u) for u in users]
+    """
+    opts = model._meta
+    fields = tuple(opts.get_field(n) for n in field_names) or tuple(opts.fields)
+    formatters = tuple(get_cell_formatter(f) for f in fields)
+    
+    def render_row(instance):
+        return [formatter(instance) for formatter in formatters]
+    render_row.fields = fields
+    
+    return render_row
 
-    return value
+def field_to_value(field, instance):
+    """Tries to convert a model field value in something smarter to render.
+    """
+    return get_value_formatter(field)(instance)
 
 def field_to_string(field, instance):
     """All-in-one conversion from a model field value to a smart string representation.
     """
-    return value_to_string(field_to_value(field, instance))
+    return value_to_string(get_value_formatter(field)(instance))
+
+def field_to_cell(field, instance):
+    """Returns the plain string representation of a model field value in a list.
+    """
+    return get_cell_formatter(field)(instance)
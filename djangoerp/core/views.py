@@ -15,26 +15,208 @@ __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
 
-from django.http import HttpResponseRedirect
-from django.utils.translation import ugettext_lazy as _
+import csv
+import json
+import threading
+import time
+from hashlib import md5
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, EmptyResultSet, ImproperlyConfigured
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.apps import apps
+from django.db import connections, transaction
+from django.db import models
+from django.db.models import Q, prefetch_related_objects
+from django.http import HttpResponseRedirect, StreamingHttpResponse, JsonResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.utils.translation import ugettext_lazy as _, get_language
 from django.utils.decorators import method_decorator
+from django.utils.module_loading import import_string
+from django.utils.functional import cached_property, SimpleLazyObject
+from django.utils.text import slugify
 from django.urls import reverse
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import UpdateView, DeleteView
 from django.views.generic.list import ListView
 from django.template.response import TemplateResponse
 from django.contrib.auth import get_user_model
+from django.contrib import messages
 from django.contrib.messages.views import SuccessMessageMixin
 
-from .decorators import obj_permission_required as permission_required
+from .decorators import obj_permission_required as permission_required, get_view_object
 from .utils import clean_http_referer, set_path_kwargs
-from .models import User
+from .utils.db import statement_timeout, StatementTimeout
+from .utils.models import get_related_lookups, get_filter_lookups, delete_in_chunks
+from .utils.rendering import get_row_renderer
+from .utils.pagination import KeysetPaginator, CountingPaginator
+from .models import User, ObjectPermission
 from .forms.auth import UserForm
 
 
+DELETE_JOB_CHUNK_SIZE = 500
+DELETE_JOB_TIMEOUT = 60 * 60
+# Unfinished jobs not updated for this long (in seconds) are reported as failed.
+DELETE_JOB_STALE_AFTER = 5 * 60
+
+
 def _get_user(request, *args, **kwargs):
     pk = kwargs.get("pk", None)
-    return get_user_model().objects.get(pk=pk)
+    return get_object_or_404(get_user_model(), pk=pk)
+
+class ModelListQueryPlan(object):
+    """The list parameters of a request, parsed only once.
+    
+    Filters, ordering, page and selection are read from GET/POST when first
+    needed and then shared by all the "ModelListView" mixins, together with
+    the unfiltered queryset.
+    """
+    def __init__(self, request, prefix=""):
+        self.request = request
+        self.GET = request.GET
+        self.POST = request.POST
+        self.prefix = prefix
+        self.unfiltered_queryset = None
+        self.rejected_filters = None
+        
+    def is_valid_for(self, request, prefix=""):
+        return self.request is request\
+            and self.GET is request.GET\
+            and self.POST is request.POST\
+            and self.prefix == prefix
+    
+    @cached_property
+    def filter_query(self):
+        filter_query = {}
+        filter_arg_name_prefix = "%sfilter_by_" % self.prefix
+        for arg_name, arg_value in list(self.GET.items()):
+            if arg_value and arg_name.startswith(filter_arg_name_prefix):
+                arg_name = arg_name.replace(filter_arg_name_prefix, "")
+                filter_query.update({arg_name: arg_value})
+        return filter_query
+        
+    @cached_property
+    def order_by(self):
+        return self.GET.get("%sorder_by" % self.prefix, None)
+        
+    @cached_property
+    def page(self):
+        return self.GET.get("%spage" % self.prefix, None)
+        
+    @cached_property
+    def export_format(self):
+        return self.GET.get("%sexport" % self.prefix, None)
+        
+    @cached_property
+    def delete_job(self):
+        return self.GET.get("%sdelete_job" % self.prefix, None)
+        
+    @cached_property
+    def autocomplete(self):
+        return self.GET.get("%sautocomplete" % self.prefix, None)
+        
+    @cached_property
+    def term(self):
+        return self.GET.get("%sterm" % self.prefix, "")
+        
+    @cached_property
+    def selected_uids(self):
+        selected_uids = []
+        selected_all = self.POST.get("%sselect_all" % self.prefix, False)
+        
+        if selected_all:
+            selected_uids = "*"
+            
+        else:
+            for k, v in list(self.POST.items()):
+                if k.startswith("%sselect_" % self.prefix) and v:
+                    selected_uids.append(k.rpartition('_')[2])
+                    
+        return selected_uids
+        
+def get_list_query_plan(view, request=None):
+    """Returns the list query plan of the view's current (or given) request.
+    """
+    request = request or view.request
+    prefix = view.get_list_prefix()
+    plan = getattr(view, '_list_query_plan', None)
+    if plan is None or not plan.is_valid_for(request, prefix):
+        plan = ModelListQueryPlan(request, prefix)
+        view._list_query_plan = plan
+    return plan
+
+def _get_delete_job_key(job_id):
+    return "djangoerp.delete_job.%s" % job_id
+
+def get_delete_job(job_id):
+    """Returns the progress of the given background delete job (if any).
+    
+    The returned dict is in the form:
+    
+    {"deleted": <deleted items>, "total": <items to delete>, "done": <bool>, "failed": <bool>, "updated": <timestamp>}
+    
+    Unfinished jobs whose progress has not been updated for more than
+    DELETE_JOB_STALE_AFTER seconds (i.e. their worker died) are reported as
+    failed.
+    """
+    progress = cache.get(_get_delete_job_key(job_id))
+    if progress and not progress["done"]\
+    and time.time() - progress.get("updated", 0) > DELETE_JOB_STALE_AFTER:
+        progress.update(done=True, failed=True)
+    return progress
+
+def run_in_thread(func, *args):
+    """Runs a background delete job in a daemon thread of the current process.
+    
+    Only suitable for single-process deployments (i.e. development): the job
+    dies with the process which runs it. To use it, set LIST_DELETE_JOB_RUNNER
+    to "djangoerp.core.views.run_in_thread".
+    """
+    def _target():
+        try:
+            func(*args)
+        finally:
+            connections.close_all()
+            
+    threading.Thread(target=_target, daemon=True).start()
+
+def delete_objects_job(job_id, model_label, pks, chunk_size=DELETE_JOB_CHUNK_SIZE, using=None):
+    """Deletes the objects of model_label identified by pks, as the background
+    delete job job_id.
+    
+    Objects are deleted in batches of chunk_size, each one in its own
+    transaction, and the progress of the job is updated after each batch.
+    
+    It only takes serializable arguments: register it as a task of your task
+    queue and call it from the delete job runner. i.e.:
+    
+    >> @app.task
+    >> def delete_task(*args):
+    >>     delete_objects_job(*args)
+    >>
+    >> def run_delete_job(func, *args):
+    >>     delete_task.delay(*args)
+    """
+    key = _get_delete_job_key(job_id)
+    progress = cache.get(key) or {"deleted": 0, "total": len(pks), "done": False, "failed": False}
+    manager = apps.get_model(model_label)._base_manager.db_manager(using)
+    
+    try:
+        for i in range(0, len(pks), chunk_size):
+            with transaction.atomic(using=manager.db):
+                manager.filter(pk__in=pks[i:i + chunk_size]).delete()
+            progress["deleted"] = min(i + chunk_size, len(pks))
+            progress["updated"] = time.time()
+            cache.set(key, progress, DELETE_JOB_TIMEOUT)
+    except Exception:
+        progress["failed"] = True
+        raise
+    finally:
+        progress["done"] = True
+        progress["updated"] = time.time()
+        cache.set(key, progress, DELETE_JOB_TIMEOUT)
 
 class SetCancelUrlMixin(object):
     """Mixin that allows to set an URL to "rollback" (cancel) the current view.
@@ -63,10 +245,44 @@ class BaseModelListView(ListView):
      * list_uid -- The unique ID of the model list.
                    Set the "list_uid" variable or overwrite the "get_list_uid"
                    method.
+     * list_aggregates -- If True, column totals of all the listed items are
+                          shown in the list footer [default: False].
+                          Set the "list_aggregates" variable or overwrite the
+                          "get_list_aggregates" method.
+     * list_required_fields -- Fields loaded together with the "field_list"
+                               ones, because needed to render links and
+                               actions (i.e. "slug"). When a "field_list" is
+                               given, only these fields and the primary key
+                               are retrieved from the database.
+                               Set the "list_required_fields" variable or
+                               overwrite the "get_list_required_fields" method.
+     * paginate_by_keyset -- If True, pages are retrieved seeking from a cursor
+                             instead of using an offset [default: False].
+                             Set the "paginate_by_keyset" variable or overwrite
+                             the "get_paginate_by_keyset" method.
+     * count_strategy -- How the total number of items is counted: "exact",
+                         "cached", "estimated" or "capped" [default: "exact"].
+                         Set the "count_strategy" variable or overwrite the
+                         "get_count_strategy" method.
+     * count_limit -- The maximum number of items counted by the "capped"
+                      strategy [default: 1000].
+                      Set the "count_limit" variable or overwrite the
+                      "get_count_limit" method.
+     * count_timeout -- The lifetime of counts stored by the "cached" strategy
+                        [default: LIST_COUNT_CACHE_TIMEOUT setting].
+                        Set the "count_timeout" variable or overwrite the
+                        "get_count_timeout" method.
     """
     field_list = None
     list_template_name = "elements/model_list.html"
     list_uid = ""
+    list_aggregates = False
+    list_required_fields = []
+    paginate_by_keyset = False
+    paginator_class = CountingPaginator
+    count_strategy = "exact"
+    count_limit = 1000
+    count_timeout = None
     
     def __init__(self, field_list=None, list_template_name=None, list_uid=None, *args, **kwargs):
         super(BaseModelListView, self).__init__(*args, **kwargs)
@@ -86,6 +302,37 @@ class BaseModelListView(ListView):
     def get_list_uid(self):
         return self.list_uid
         
+    def get_list_aggregates(self):
+        return self.list_aggregates
+        
+    def get_list_required_fields(self):
+        return self.list_required_fields
+        
+    def get_list_only_fields(self):
+        field_list = self.get_field_list()
+        if not field_list:
+            return None
+        return list(field_list) + list(self.get_list_required_fields())
+        
+    def get_queryset(self):
+        qs = super(BaseModelListView, self).get_queryset()
+        
+        only_fields = self.get_list_only_fields()
+        
+        if only_fields:
+            opts = qs.model._meta
+            names = [opts.pk.name]
+            for name in only_fields:
+                try:
+                    f = opts.get_field(name)
+                except FieldDoesNotExist:
+                    continue
+                if f.concrete and not f.many_to_many:
+                    names.append(f.name)
+            return qs.only(*names)
+            
+        return qs
+        
     def get_list_prefix(self):
         uid = self.get_list_uid()
         if uid:
@@ -93,8 +340,36 @@ class BaseModelListView(ListView):
         
         return ""
         
+    def get_paginate_by_keyset(self):
+        return self.paginate_by_keyset
+        
+    def get_count_strategy(self):
+        return self.count_strategy
+        
+    def get_count_limit(self):
+        return self.count_limit
+        
+    def get_count_timeout(self):
+        if self.count_timeout is None:
+            return getattr(settings, 'LIST_COUNT_CACHE_TIMEOUT', 300)
+        return self.count_timeout
+        
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        kwargs.setdefault('count_strategy', self.get_count_strategy())
+        kwargs.setdefault('count_limit', self.get_count_limit())
+        kwargs.setdefault('count_timeout', self.get_count_timeout())
+        return super(BaseModelListView, self).get_paginator(queryset, per_page, orphans, allow_empty_first_page, **kwargs)
+        
     def paginate_queryset(self, queryset, page_size):
         self.page_kwarg = "%spage" % self.get_list_prefix()
+        if self.get_paginate_by_keyset():
+            paginator = KeysetPaginator(queryset, page_size)
+            cursor = get_list_query_plan(self).page
+            try:
+                page = paginator.page(cursor)
+            except InvalidPage as e:
+                raise Http404(_('Invalid page (%(page_number)s): %(message)s') % {'page_number': cursor, 'message': str(e)})
+            return (paginator, page, page.object_list, page.has_other_pages())
         return super(BaseModelListView, self).paginate_queryset(queryset, page_size)
     
     def get_context_data(self, *args, **kwargs):
@@ -102,6 +377,7 @@ class BaseModelListView(ListView):
         context['field_list'] = self.get_field_list()
         context['list_template_name'] = self.get_list_template_name()
         context['list_uid'] = self.get_list_uid()
+        context['list_aggregates'] = self.get_list_aggregates()
         return context
 
 class ModelListDeleteMixin(object):
@@ -115,54 +391,120 @@ class ModelListDeleteMixin(object):
                                deletion confrimation page. 
                                Set the "delete_template_name" variable or
                                overwrite the "get_delete_template_name" method.
+     * delete_chunk_size -- If set, selected items are deleted in batches of
+                            this size, each one in its own transaction
+                            [default: None, all at once].
+                            Set the "delete_chunk_size" variable or overwrite
+                            the "get_delete_chunk_size" method.
+     * delete_in_background -- If True, selected items are deleted in batches
+                               by a background job, whose progress is shown
+                               on the list page [default: False]. It requires
+                               a delete job runner and, on multi-process
+                               deployments, a default cache shared among
+                               processes.
+                               Set the "delete_in_background" variable or
+                               overwrite the "get_delete_in_background" method.
+     * delete_job_runner -- The callable which runs a background delete job,
+                            called as "runner(func, *args)" and expected to
+                            call "func(*args)" outside of the request (i.e.
+                            in a task queue worker; wrap it in "staticmethod"
+                            when set on the class). "func" is always
+                            "delete_objects_job" and "args" are serializable
+                            [default: the callable named by
+                            LIST_DELETE_JOB_RUNNER setting, if any].
+                            Set the "delete_job_runner" variable or overwrite
+                            the "get_delete_job_runner" method.
     """
     delete_template_name = "base_model_list_confirm_delete.html"
+    delete_chunk_size = None
+    delete_in_background = False
+    delete_job_runner = None
         
     def get_selected_uids(self, request, *args, **kwargs):
-        selected_uids = []
-        prefix = self.get_list_prefix()
-        selected_all = request.POST.get("%sselect_all" % prefix, False)
-        
-        if selected_all:
-            selected_uids = "*"
-            
-        else:
-            for k, v in list(request.POST.items()):
-                if k.startswith("%sselect_" % prefix) and v:
-                    selected_uids.append(k.rpartition('_')[2])
-                    
-        return selected_uids
+        return get_list_query_plan(self, request).selected_uids
         
     def get_delete_template_name(self):
         return self.delete_template_name
+        
+    def get_delete_chunk_size(self):
+        return self.delete_chunk_size
+        
+    def get_delete_in_background(self):
+        return self.delete_in_background
+        
+    def start_delete_job(self, queryset, chunk_size):
+        job_id = uuid4().hex
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+        cache.set(
+            _get_delete_job_key(job_id),
+            {"deleted": 0, "total": len(pks), "done": False, "failed": False, "updated": time.time()},
+            DELETE_JOB_TIMEOUT
+        )
+        self.run_delete_job(delete_objects_job, job_id, queryset.model._meta.label, pks, chunk_size, queryset.db)
+        return job_id
+        
+    def get_delete_job_runner(self):
+        if self.delete_job_runner is not None:
+            return self.delete_job_runner
+        runner = getattr(settings, 'LIST_DELETE_JOB_RUNNER', None)
+        return runner and import_string(runner)
+        
+    def run_delete_job(self, func, *args):
+        runner = self.get_delete_job_runner()
+        if not runner:
+            raise ImproperlyConfigured(
+                "%s deletes items in background but no delete job runner is "
+                "configured. Set LIST_DELETE_JOB_RUNNER or define %s.delete_job_runner."
+                % (self.__class__.__name__, self.__class__.__name__)
+            )
+        runner(func, *args)
 
     def delete_selected(self, request, *args, **kwargs):
         prefix = self.get_list_prefix()
         selected_uids = self.get_selected_uids(request, *args, **kwargs)
         queryset = self.get_queryset()
         selected_queryset = queryset
-        if hasattr(queryset, '_clone'):
-            selected_queryset = queryset._clone()
           
         if isinstance(selected_uids, list):
             selected_queryset = selected_queryset.filter(pk__in=selected_uids)   
         
-        if selected_queryset:
+        if selected_queryset.exists():
             if "%sdelete_selected" % prefix in request.POST:
                 return TemplateResponse(request, self.get_delete_template_name(), {"object_list": selected_queryset})
 
             if "%sconfirm_delete_selected" % prefix in request.POST:
-                selected_queryset.delete()
-                curr_page = request.GET.get(self.page_kwarg, 1)
+                chunk_size = self.get_delete_chunk_size()
+                if self.get_delete_in_background():
+                    job_id = self.start_delete_job(selected_queryset, chunk_size or DELETE_JOB_CHUNK_SIZE)
+                    return HttpResponseRedirect(set_path_kwargs(request, **{"%sdelete_job" % prefix: job_id}))
+                elif chunk_size:
+                    delete_in_chunks(selected_queryset, chunk_size)
+                else:
+                    selected_queryset.delete()
+                try:
+                    curr_page = int(get_list_query_plan(self, request).page or 1)
+                except ValueError:
+                    # Keyset cursors are still valid after a deletion.
+                    curr_page = 1
                 page_size = self.get_paginate_by(queryset)
-                item_count = queryset.count()
-                page_count = int(max(1, item_count / page_size))
-                if curr_page > page_count:
-                    path = set_path_kwargs(request, **{self.page_kwarg: page_count})
-                    return HttpResponseRedirect(path)
+                # Counting past the current page is not needed to know if it
+                # still exists (and there is nothing to check on the first one).
+                if page_size and curr_page > 1:
+                    item_count = queryset.order_by()[:curr_page * page_size].count()
+                    page_count = max(1, (item_count + page_size - 1) // page_size)
+                    if curr_page > page_count:
+                        path = set_path_kwargs(request, **{self.page_kwarg: page_count})
+                        return HttpResponseRedirect(path)
         
         return self.get(request, *args, **kwargs)
         
+    def get_context_data(self, *args, **kwargs):
+        context = super(ModelListDeleteMixin, self).get_context_data(*args, **kwargs)
+        job_id = get_list_query_plan(self).delete_job
+        if job_id:
+            context['delete_job'] = get_delete_job(job_id)
+        return context
+        
     def post(self, request, *args, **kwargs):
         selected_uids = self.get_selected_uids(request, *args, **kwargs)
         
@@ -175,11 +517,253 @@ class ModelListDeleteMixin(object):
         
 class ModelListFilteringMixin(object):
     """Mixin to be used with "ModelListView" to filter the list items.
+    
+    Choices of ForeignKey filters are the related objects actually referenced
+    by the (unfiltered) list, retrieved with a single query and cached. When
+    they are too many, the filter switches to an autocomplete input, served
+    by the same view with "[<list_uid>_]autocomplete=<attname>" and
+    "[<list_uid>_]term=<text>".
+    
+    Only cheap lookups are accepted by default (i.e. no pattern matching on
+    TextFields, no filters across relations): the other ones are ignored with
+    a warning. List queries (counting, items, aggregates, filter choices and
+    autocomplete ones) lasting more than the statement timeout are cancelled
+    and the filters are reset with an error message (or, without filters, an
+    error page is shown). Exports are streamed after the view returns, so
+    they are not subject to the timeout.
+    
+    It could be customize using the following variables:
+    
+     * filter_lookups -- A dict mapping field names (or relation paths, i.e.
+                         "perm__codename") to the lookups allowed on them
+                         [default: None, use "get_filter_lookups" on fields].
+                         Set the "filter_lookups" variable or overwrite the
+                         "get_filter_lookups" method.
+     * list_statement_timeout -- The maximum duration (in ms) of the list
+                                 queries [default: LIST_STATEMENT_TIMEOUT
+                                 setting].
+                                 Set the "list_statement_timeout" variable or
+                                 overwrite the "get_list_statement_timeout"
+                                 method.
+     * list_timeout_template_name -- The template name which is used to
+                                     render the error page shown when the
+                                     unfiltered list can't be loaded in time.
+                                     Set the "list_timeout_template_name"
+                                     variable or overwrite the
+                                     "get_list_timeout_template_name" method.
+     * filter_choices_limit -- The maximum number of choices listed in a
+                               filter [default: 100].
+                               Set the "filter_choices_limit" variable or
+                               overwrite the "get_filter_choices_limit" method.
+     * filter_choices_timeout -- The lifetime of cached filter choices
+                                 [default: LIST_FILTER_CHOICES_TIMEOUT setting].
+                                 Set the "filter_choices_timeout" variable or
+                                 overwrite the "get_filter_choices_timeout"
+                                 method.
+     * filter_choices_related -- A dict mapping ForeignKey attnames to the
+                                 relations of the related model followed by
+                                 its string representation, loaded together
+                                 with the choices (and the autocomplete ones)
+                                 [default: None, the relations sorting the
+                                 related model].
+                                 Set the "filter_choices_related" variable or
+                                 overwrite the "get_filter_choices_related"
+                                 method.
+     * autocomplete_search_fields -- A dict mapping ForeignKey attnames to the
+                                     fields of the related model matched (by
+                                     prefix) by autocomplete terms
+                                     [default: None, the indexed CharFields].
+                                     Set the "autocomplete_search_fields"
+                                     variable or overwrite the
+                                     "get_autocomplete_search_fields" method.
+     * autocomplete_min_length -- The minimum length of autocomplete terms
+                                  (but pks) [default: 3].
+                                  Set the "autocomplete_min_length" variable or
+                                  overwrite the "get_autocomplete_min_length"
+                                  method.
     """
+    filter_lookups = None
+    list_statement_timeout = None
+    list_timeout_template_name = "base_list_timeout.html"
+    filter_choices_limit = 100
+    filter_choices_timeout = None
+    filter_choices_related = None
+    autocomplete_limit = 20
+    autocomplete_search_fields = None
+    autocomplete_min_length = 3
+    
+    def get_filter_lookups(self):
+        return self.filter_lookups
+        
+    def get_list_statement_timeout(self):
+        if self.list_statement_timeout is None:
+            return getattr(settings, 'LIST_STATEMENT_TIMEOUT', None)
+        return self.list_statement_timeout
+        
+    def get_list_timeout_template_name(self):
+        return self.list_timeout_template_name
+        
+    def get_filter_choices_limit(self):
+        return self.filter_choices_limit
+        
+    def get_filter_choices_timeout(self):
+        if self.filter_choices_timeout is None:
+            return getattr(settings, 'LIST_FILTER_CHOICES_TIMEOUT', 300)
+        return self.filter_choices_timeout
+        
+    def get_filter_choices_related(self, field):
+        choices_related = self.filter_choices_related or {}
+        if field.attname in choices_related:
+            return choices_related[field.attname]
+        # The relations sorting the related model are joined anyway.
+        opts = field.related_model._meta
+        related = []
+        for name in opts.ordering:
+            if isinstance(name, str) and "__" in name:
+                path = name.lstrip("-+").rpartition("__")[0]
+                if path not in related:
+                    related.append(path)
+        return related
+        
+    def get_autocomplete_search_fields(self, field):
+        search_fields = self.autocomplete_search_fields or {}
+        if field.attname in search_fields:
+            return search_fields[field.attname]
+        # Only indexed fields can be matched by prefix without a full scan.
+        return [f.name for f in field.related_model._meta.fields if isinstance(f, models.CharField) and (f.db_index or f.unique)]
+        
+    def get_autocomplete_min_length(self):
+        return self.autocomplete_min_length
+        
+    def get_filter_choice_fields(self, queryset):
+        opts = queryset.model._meta
+        field_list = self.get_field_list() if hasattr(self, "get_field_list") else None
+        fields = [opts.get_field(n) for n in (field_list or [])] or opts.fields
+        return [f for f in fields if f.concrete and (f.many_to_one or f.one_to_one)]
+        
+    def _get_related_in_list(self, field, queryset):
+        lookup = "%s__in" % field.target_field.name
+        values = queryset.order_by().values(field.attname)
+        related = field.related_model._default_manager.filter(**{lookup: values})
+        select_related = self.get_filter_choices_related(field)
+        if select_related:
+            related = related.select_related(*select_related)
+        return related
+        
+    def _get_field_filter_choices(self, field, queryset):
+        related = self._get_related_in_list(field, queryset)
+        try:
+            sql, params = related.query.sql_with_params()
+        except EmptyResultSet:
+            return {"choices": [], "autocomplete": False}
+        # Labels are translated: choices are cached per language.
+        key = "djangoerp.filter_choices.%s" % md5(("%s|%r|%s" % (sql, params, get_language())).encode("utf-8")).hexdigest()
+        choices = cache.get(key)
+        if choices is None:
+            limit = self.get_filter_choices_limit()
+            objects = list(related[:limit + 1])
+            if len(objects) > limit:
+                choices = {"choices": [], "autocomplete": True}
+            else:
+                attname = field.target_field.attname
+                choices = {"choices": [(getattr(o, attname), "%s" % o) for o in objects], "autocomplete": False}
+            cache.set(key, choices, self.get_filter_choices_timeout())
+        return choices
+        
+    def get_filter_choices(self, queryset):
+        """Returns the choices of ForeignKey filters, by field attname.
+        """
+        return dict([(f.attname, self._get_field_filter_choices(f, queryset)) for f in self.get_filter_choice_fields(queryset)])
+        
+    def _get_timed_filter_choices(self, queryset):
+        with statement_timeout(self.get_list_statement_timeout(), queryset.db):
+            return self.get_filter_choices(queryset)
+        
+    def autocomplete(self, request, attname, term="", *args, **kwargs):
+        self.get_queryset()
+        queryset = get_list_query_plan(self, request).unfiltered_queryset
+        fields = dict([(f.attname, f) for f in self.get_filter_choice_fields(queryset)])
+        if attname not in fields:
+            raise Http404(_("Unknown filter: %s") % attname)
+        field = fields[attname]
+        if len(term) < self.get_autocomplete_min_length() and not term.isdigit():
+            return JsonResponse([], safe=False)
+        related = self._get_related_in_list(field, queryset)
+        q = Q()
+        for name in self.get_autocomplete_search_fields(field):
+            q |= Q(**{"%s__istartswith" % name: term})
+        if term.isdigit():
+            q |= Q(pk=term)
+        if not q:
+            return JsonResponse([], safe=False)
+        related = related.filter(q)
+        attname = field.target_field.attname
+        return JsonResponse([{"value": getattr(o, attname), "label": "%s" % o} for o in related[:self.autocomplete_limit]], safe=False)
+        
+    def get(self, request, *args, **kwargs):
+        plan = get_list_query_plan(self, request)
+        
+        if plan.autocomplete:
+            try:
+                with statement_timeout(self.get_list_statement_timeout()):
+                    return self.autocomplete(request, plan.autocomplete, plan.term, *args, **kwargs)
+            except StatementTimeout:
+                return JsonResponse([], safe=False)
+            
+        try:
+            with statement_timeout(self.get_list_statement_timeout()):
+                response = super(ModelListFilteringMixin, self).get(request, *args, **kwargs)
+            # Items, aggregates and filter choices are fetched while rendering
+            # (under the same timeout, see "get_context_data").
+            if hasattr(response, "render"):
+                response.render()
+            return response
+        except StatementTimeout:
+            if not plan.filter_query:
+                return TemplateResponse(request, self.get_list_timeout_template_name(), {"view": self}, status=503)
+            messages.error(request, _("The filter is too expensive: please narrow it down."), fail_silently=True)
+            filter_by_key = "%sfilter_by_" % self.get_list_prefix()
+            return HttpResponseRedirect(set_path_kwargs(request, **dict([("%s%s" % (filter_by_key, k), None) for k in plan.filter_query])))
+        
+    def clean_filter_query(self, model, filter_query):
+        """Splits filter_query in the allowed and the rejected filters.
+        
+        A filter ("<path>[__<lookup>]") is allowed if its lookup is listed in
+        "get_filter_lookups" for its path or, by default, if its path is a
+        field of model and its lookup is returned by "get_filter_lookups"
+        utility for that field.
+        """
+        allowed, rejected = {}, {}
+        filter_lookups = self.get_filter_lookups() or {}
+        opts = model._meta
+        for key, value in list(filter_query.items()):
+            # The last part of the key could be either a lookup or a field.
+            path, sep, lookup = key.rpartition("__")
+            candidates = [(key, "exact")] + ([(path, lookup)] if sep else [])
+            for path, lookup in candidates:
+                lookups = filter_lookups.get(path, None)
+                if lookups is None and "__" not in path:
+                    try:
+                        lookups = get_filter_lookups(opts.get_field(path))
+                    except FieldDoesNotExist:
+                        pass
+                if lookups and lookup in lookups:
+                    allowed[key] = value
+                    break
+            else:
+                rejected[key] = value
+        return allowed, rejected
+        
     def get_queryset(self):
         qs = super(ModelListFilteringMixin, self).get_queryset()
         
-        filter_query = self.get_filter_query_from_get()
+        plan = get_list_query_plan(self)
+        plan.unfiltered_queryset = qs
+        filter_query, rejected = self.clean_filter_query(qs.model, self.get_filter_query_from_get())
+        
+        if rejected and plan.rejected_filters is None:
+            messages.warning(self.request, _("Some filters have been ignored: %s") % ", ".join(sorted(rejected)), fail_silently=True)
+        plan.rejected_filters = rejected
         
         if filter_query:
             return qs.filter(**filter_query)
@@ -189,7 +773,12 @@ class ModelListFilteringMixin(object):
     def get_context_data(self, *args, **kwargs):
         context = super(ModelListFilteringMixin, self).get_context_data(*args, **kwargs)
         filter_query = self.get_filter_query_from_get()
-        context['unfiltered_object_list'] = super(ModelListFilteringMixin, self).get_queryset()
+        unfiltered_queryset = get_list_query_plan(self).unfiltered_queryset
+        if unfiltered_queryset is None:
+            unfiltered_queryset = super(ModelListFilteringMixin, self).get_queryset()
+        context['unfiltered_object_list'] = unfiltered_queryset
+        context['%slist_statement_timeout' % self.get_list_prefix()] = self.get_list_statement_timeout()
+        context['%slist_filter_choices' % self.get_list_prefix()] = SimpleLazyObject(lambda: self._get_timed_filter_choices(unfiltered_queryset))
         context['%slist_filter_by' % self.get_list_prefix()] = dict([(k.rpartition('__')[0] or k.rpartition('__')[2], (k.rpartition('__')[2], v)) for k, v in list(filter_query.items())]) or None
         return context
         
@@ -222,14 +811,7 @@ class ModelListFilteringMixin(object):
         return filter_query
         
     def get_filter_query_from_get(self):
-        filter_query = {}
-        list_prefix = self.get_list_prefix()
-        filter_arg_name_prefix = "%sfilter_by_" % list_prefix
-        for arg_name, arg_value in list(self.request.GET.items()):
-            if arg_value and arg_name.startswith(filter_arg_name_prefix):
-                arg_name = arg_name.replace(filter_arg_name_prefix, "")
-                filter_query.update({arg_name: arg_value})
-        return filter_query
+        return dict(get_list_query_plan(self).filter_query)
   
 class ModelListOrderingMixin(object):
     """Mixin to be used with "ModelListView" to order the list items.
@@ -237,8 +819,7 @@ class ModelListOrderingMixin(object):
     def get_queryset(self):
         qs = super(ModelListOrderingMixin, self).get_queryset()
             
-        ord_arg_name = "%sorder_by" % self.get_list_prefix()
-        self._order_query = self.request.GET.get(ord_arg_name, None)
+        self._order_query = get_list_query_plan(self).order_by
         
         if self._order_query:
             return qs.order_by(self._order_query)
@@ -247,15 +828,141 @@ class ModelListOrderingMixin(object):
     
     def get_context_data(self, *args, **kwargs):
         context = super(ModelListOrderingMixin, self).get_context_data(*args, **kwargs)
-        
-        self.get_queryset()
             
-        context['list_order_by'] = self._order_query
+        context['list_order_by'] = get_list_query_plan(self).order_by
         
         return context      
         
-class ModelListView(ModelListDeleteMixin, ModelListOrderingMixin, ModelListFilteringMixin, BaseModelListView):
-    """Default model list view with support for deleting and ordering.
+class ModelListPermissionMixin(object):
+    """Mixin to be used with "ModelListView" to list only permitted items.
+    
+    The list is narrowed in SQL, so only the items on which the current user
+    has the required permission are counted and paginated.
+    
+    It could be customize using the following variables:
+    
+     * list_perm -- The permission (i.e. "menus.view_link") the current user
+                    must have on each listed item [default: None, all items
+                    are listed].
+                    Set the "list_perm" variable or overwrite the
+                    "get_list_perm" method.
+    """
+    list_perm = None
+    
+    def get_list_perm(self):
+        return self.list_perm
+        
+    def get_queryset(self):
+        qs = super(ModelListPermissionMixin, self).get_queryset()
+        
+        perm = self.get_list_perm()
+        
+        if perm:
+            return ObjectPermission.objects.get_permitted_objects(self.request.user, perm, qs)
+            
+        return qs
+        
+class _Echo(object):
+    """A file-like object which just returns what is written in it.
+    """
+    def write(self, value):
+        return value
+
+class ModelListExportMixin(object):
+    """Mixin to be used with "ModelListView" to export the list items.
+    
+    Adding "[<list_uid>_]export=<format>" to the list URL streams all the
+    filtered and ordered items (not just the current page), with the columns
+    of "field_list". Items are retrieved in chunks, so memory usage doesn't
+    grow with the number of exported items. Exports are streamed after the
+    view returns, so they are exempt from the list statement timeout.
+    
+    It could be customize using the following variables:
+    
+     * export_formats -- The allowed export formats [default: csv and jsonl].
+                         Set the "export_formats" variable or overwrite the
+                         "get_export_formats" method.
+     * export_chunk_size -- The number of items retrieved at once
+                            [default: 2000].
+                            Set the "export_chunk_size" variable or overwrite
+                            the "get_export_chunk_size" method.
+    """
+    export_formats = ("csv", "jsonl")
+    export_chunk_size = 2000
+    
+    def get_export_formats(self):
+        return self.export_formats
+        
+    def get_export_chunk_size(self):
+        return self.export_chunk_size
+        
+    def get_export_fields(self, queryset):
+        opts = queryset.model._meta
+        fields = []
+        for name in (self.get_field_list() or []):
+            try:
+                fields.append(opts.get_field(name))
+            except FieldDoesNotExist:
+                # i.e. properties or methods.
+                continue
+        return fields or opts.fields
+        
+    def get_export_filename(self, queryset, export_format):
+        return "%s.%s" % (slugify(queryset.model._meta.verbose_name_plural), export_format)
+        
+    def iter_export_objects(self, queryset, fields):
+        prefetch_related = get_related_lookups(fields)
+        chunk_size = self.get_export_chunk_size()
+        chunk = []
+        # "iterator()" ignores "prefetch_related()": prefetch chunk by chunk.
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(obj)
+            if len(chunk) == chunk_size:
+                prefetch_related_objects(chunk, *prefetch_related)
+                yield from chunk
+                chunk = []
+        prefetch_related_objects(chunk, *prefetch_related)
+        yield from chunk
+        
+    def iter_csv(self, queryset, fields):
+        writer = csv.writer(_Echo())
+        render_row = get_row_renderer(queryset.model, tuple(f.name for f in fields))
+        yield writer.writerow(['%s' % f.verbose_name for f in fields])
+        for obj in self.iter_export_objects(queryset, fields):
+            yield writer.writerow(render_row(obj))
+            
+    def iter_jsonl(self, queryset, fields):
+        def _to_json(f, obj):
+            if f.many_to_many:
+                return ['%s' % v for v in f.value_from_object(obj)]
+            return f.value_from_object(obj)
+            
+        for obj in self.iter_export_objects(queryset, fields):
+            yield json.dumps(dict([(f.name, _to_json(f, obj)) for f in fields]), cls=DjangoJSONEncoder) + "\n"
+        
+    def export(self, request, export_format, *args, **kwargs):
+        queryset = self.get_queryset()
+        fields = self.get_export_fields(queryset)
+        content_types = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+        response = StreamingHttpResponse(
+            getattr(self, "iter_%s" % export_format)(queryset, fields),
+            content_type="%s; charset=utf-8" % content_types.get(export_format, "text/plain")
+        )
+        response['Content-Disposition'] = 'attachment; filename="%s"' % self.get_export_filename(queryset, export_format)
+        return response
+        
+    def get(self, request, *args, **kwargs):
+        export_format = get_list_query_plan(self, request).export_format
+        
+        if export_format:
+            if export_format not in self.get_export_formats():
+                raise Http404(_("Unknown export format: %s") % export_format)
+            return self.export(request, export_format, *args, **kwargs)
+            
+        return super(ModelListExportMixin, self).get(request, *args, **kwargs)
+        
+class ModelListView(ModelListExportMixin, ModelListDeleteMixin, ModelListOrderingMixin, ModelListFilteringMixin, ModelListPermissionMixin, BaseModelListView):
+    """Default model list view with support for deleting, ordering and exporting.
     """
     pass
     
@@ -264,6 +971,12 @@ class UserMixin(object):
     """
     model = get_user_model()
     
+    def get_object(self, queryset=None):
+        if queryset is None:
+            # Reuses the user already loaded by "obj_permission_required".
+            return get_view_object(self, _get_user)
+        return super(UserMixin, self).get_object(queryset)
+    
 class UserCreateUpdateMixin(SuccessMessageMixin, SetCancelUrlMixin, UserMixin):
     """A mixin class for create or update User model.
     """
@@ -17,11 +17,11 @@ __version__ = '0.0.5'
 
 from django import template
 from django.conf import settings
-from django.template import Engine
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from djangoerp.core.cache import PermissionUidCache, TemplateCache
 
-from ..models import Menu
+from ..models import Menu, Link
 
 
 register = template.Library()
@@ -38,16 +38,17 @@ def _calculate_link_params(link, context):
     link.title = link.title % context
     if link.description:
         link.description = link.description % context
-    perms = ["%s.%s" % (p.content_type.app_label, p.codename) for p in link.only_with_perms.all()]
+    perm_ids = Link.only_with_perms.through.objects.filter(link_id=link.pk).values_list('permission_id', flat=True)
+    perms = PermissionUidCache().get_uids(list(perm_ids))
     link.authorized = True
     if isinstance(user, get_user_model()) and not user.is_superuser:
         if link.only_staff and not (user.is_staff or user.is_superuser):
             link.authorized = False
-        if link.only_with_perms.exists() and not user.has_perms(perms, context.get("object", None)):
+        if perms and not user.has_perms(perms, context.get("object", None)):
             link.authorized = False
     elif not user or isinstance(user, AnonymousUser):
         user = AnonymousUser()
-        if link.only_staff or link.only_with_perms.exists():
+        if link.only_staff or perms:
             link.authorized = False
         if link.only_authenticated and not user.is_authenticated:
             link.authorized = False
@@ -74,7 +75,7 @@ def _render_menu(slug, context, html_template=None, css_class=None):
             _calculate_link_params(link, context)
         html_template = html_template or menu.template_name or settings.MENU_DEFAULT_TEMPLATE
         html_template = ("%s" % html_template).replace('"', '').replace("'", "")
-        html_template = Engine.get_default().get_template(html_template)
+        html_template = TemplateCache().get(html_template)
         with context.push(slug=slug, links=links, css_class=css_class):
             result = html_template.render(context)
         return result
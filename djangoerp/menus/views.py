@@ -22,7 +22,7 @@ from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.contrib.messages.views import SuccessMessageMixin
 from djangoerp.core.utils import clean_http_referer
 from djangoerp.core.views import SetCancelUrlMixin, ModelListView
-from djangoerp.core.decorators import obj_permission_required as permission_required
+from djangoerp.core.decorators import obj_permission_required as permission_required, get_cached_object, get_view_object
 
 from .utils import get_bookmarks_for
 from .models import *
@@ -32,7 +32,7 @@ def _get_bookmarks(request, *args, **kwargs):
     return get_bookmarks_for(request.user.username)
 
 def _get_bookmark(request, *args, **kwargs):
-    bookmarks = _get_bookmarks(request, *args, **kwargs)
+    bookmarks = get_cached_object(request, _get_bookmarks, request, *args, **kwargs)
     return get_object_or_404(Bookmark, slug=kwargs.get('slug', None), menu=bookmarks)
     
 class BookmarkMixin(object):
@@ -40,13 +40,19 @@ class BookmarkMixin(object):
     
     def get_queryset(self):
         qs = super(BookmarkMixin, self).get_queryset()
-        return qs.filter(menu=_get_bookmarks(self.request, self.args, self.kwargs))
+        return qs.filter(menu=get_view_object(self, _get_bookmarks))
+        
+    def get_object(self, queryset=None):
+        if queryset is None:
+            # Reuses the bookmark already loaded by "obj_permission_required".
+            return get_view_object(self, _get_bookmark)
+        return super(BookmarkMixin, self).get_object(queryset)
     
 class BookmarkCreateUpdateMixin(SuccessMessageMixin, SetCancelUrlMixin, BookmarkMixin):
     form_class = BookmarkForm
 
     def get_form_kwargs(self):
-        menu =  _get_bookmarks(self.request, *self.args, **self.kwargs)
+        menu = get_view_object(self, _get_bookmarks)
         kwargs = super(BookmarkCreateUpdateMixin, self).get_form_kwargs()
         kwargs['menu'] = menu
         return kwargs        
@@ -64,6 +70,7 @@ class BookmarkCreateUpdateMixin(SuccessMessageMixin, SetCancelUrlMixin, Bookmark
     
 class ListBookmarkView(BookmarkMixin, ModelListView):
     field_list = ["title", "url", "description", "new_window"]
+    list_required_fields = ["slug", "context"]
     delete_template_name = "menus/bookmark_model_list_confirm_delete.html"
     paginate_by=10
     
@@ -24,7 +24,8 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.template.loader import render_to_string
 from djangoerp.core.models import validate_json
-from djangoerp.core.utils.rendering import field_to_string
+from djangoerp.core.utils.models import get_field_map
+from djangoerp.core.utils.rendering import value_to_string, get_value_formatter
 
 from .managers import *
 
@@ -190,20 +191,22 @@ class Observable(object):
     def __init__(self, *args, **kwargs):
         super(Observable, self).__init__(*args, **kwargs)
         self.__changes = {}
-        self.__field_cache = dict([(f.attname, f) for f in (self._meta.fields)])
         self.__followers_cache = None
 
     def __setattr__(self, name, value):
         try:
-            if self.pk and name in self.__field_cache:
-                field = self.__field_cache[name]
+            field_map = get_field_map(self.__class__, by_attname=True)
+            # Deferred fields being loaded have no old value to compare with.
+            if self.pk and name in field_map and name in self.__dict__:
+                field = field_map[name]
                 label = "%s" % field.verbose_name
                 if name not in self.__change_exclude:
-                    old_value = field_to_string(field, self)
+                    formatter = get_value_formatter(field)
+                    old_value = value_to_string(formatter(self))
                     if label in self.__changes:
                         old_value = self.__changes[label][0]
                     super(Observable, self).__setattr__(name, value)
-                    value = field_to_string(field, self)
+                    value = value_to_string(formatter(self))
                     if value != old_value:
                         self.__changes[label] = ("%s" % old_value, "%s" % value)
                 return
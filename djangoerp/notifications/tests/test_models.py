@@ -182,6 +182,26 @@ class ObservableTestCase(TestCase):
         self.u1.username = "u3"
         self.assertEqual(self.u1._Observable__changes, {"username": ("u1", "u3")})
         
+    def test_load_deferred_fields(self):
+        """Tests loading deferred fields isn't tracked as a change.
+        """
+        user_model = get_user_model()
+        u1 = user_model.objects.only("pk").get(pk=self.u1.pk)
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(u1.username, "u1")
+            
+        self.assertEqual(u1._Observable__changes, {})
+        
+    def test_shared_field_map(self):
+        """Tests instances don't build their own field map.
+        """
+        user_model = get_user_model()
+        user_model.objects.create(username="u2")
+        
+        for u in user_model.objects.all():
+            self.assertFalse("_Observable__field_cache" in u.__dict__)
+            
     def test_followers(self):
         """Tests following logic.
         """
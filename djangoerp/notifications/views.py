@@ -14,7 +14,7 @@ __author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
 __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, Http404
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _
 from django.utils.decorators import method_decorator
@@ -26,7 +26,7 @@ from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib.contenttypes.models import ContentType
 from django.contrib import messages
 from djangoerp.core.utils import clean_http_referer
-from djangoerp.core.decorators import obj_permission_required as permission_required
+from djangoerp.core.decorators import obj_permission_required as permission_required, get_cached_object, get_view_object
 from djangoerp.core.views import SetCancelUrlMixin, ModelListView
 
 from .models import *
@@ -46,7 +46,7 @@ def _get_object_by(object_model, object_id):
 
 def _get_object_view_perm(request, *args, **kwargs):
     object_model = kwargs.get('object_model', None)
-    content_type = _get_content_type_by(object_model)
+    content_type = get_cached_object(request, _get_content_type_by, object_model)
     app_label = content_type.app_label
     model_name = content_type.model
     return "%s.view_%s" % (app_label, model_name)
@@ -54,7 +54,8 @@ def _get_object_view_perm(request, *args, **kwargs):
 def _get_object(request, *args, **kwargs):
     object_model = kwargs.get('object_model', None)
     object_id = kwargs.get('object_id', None)
-    return _get_object_by(object_model, object_id)
+    content_type = get_cached_object(request, _get_content_type_by, object_model)
+    return get_cached_object(request, get_object_or_404, content_type.model_class(), pk=object_id)
 
 def _get_notification(request, *args, **kwargs):
     pk = kwargs.get('pk', None)
@@ -65,14 +66,14 @@ class NotificationMixin(object):
     
     def get_queryset(self):
         qs = super(NotificationMixin, self).get_queryset()
-        target = _get_object(self.request, *self.args, **self.kwargs)
+        target = get_view_object(self, _get_object)
         return qs.filter(target=target)
 
 @permission_required(_get_object_view_perm, _get_object)
 def object_follow(request, object_model, object_id, path=None, **kwargs):
     """The current user starts to follow object's activities.
     """
-    obj = _get_object_by(object_model, object_id)
+    obj = _get_object(request, object_model=object_model, object_id=object_id)
     follower = request.user
     
     if isinstance(obj, Observable):
@@ -85,7 +86,7 @@ def object_follow(request, object_model, object_id, path=None, **kwargs):
 def object_unfollow(request, object_model, object_id, path=None, **kwargs):
     """The current user stops to follow object's activities.
     """
-    obj = _get_object_by(object_model, object_id)
+    obj = _get_object(request, object_model=object_model, object_id=object_id)
     follower = request.user
 
     if isinstance(obj, Observable):
@@ -98,6 +99,7 @@ class ListNotificationView(NotificationMixin, ModelListView):
     """Displays the list of all filtered notifications.
     """
     field_list = ["title", "created", "read"]
+    list_required_fields = ["target_content_type", "target_id"]
     paginate_by=10
     
     @method_decorator(permission_required(_get_object_view_perm, _get_object))
@@ -129,6 +131,14 @@ class DeleteNotificationView(SuccessMessageMixin, SetCancelUrlMixin, Notificatio
         return super(DeleteNotificationView, self).dispatch(request, *args, **kwargs)
         
     def get_object(self, queryset=None):
-        self.object = super(DeleteNotificationView, self).get_object(queryset)
+        if queryset is None:
+            # Reuses the notification already loaded by "obj_permission_required".
+            self.object = get_view_object(self, _get_notification)
+            target = get_view_object(self, _get_object)
+            if self.object.target_id != target.pk\
+            or self.object.target_content_type_id != ContentType.objects.get_for_model(target).pk:
+                raise Http404
+        else:
+            self.object = super(DeleteNotificationView, self).get_object(queryset)
         self.success_url = reverse('notification_list', args=[self.object.target._meta.verbose_name_plural, self.object.target_id])
         return self.object
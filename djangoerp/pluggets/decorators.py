@@ -17,9 +17,9 @@ __version__ = '0.0.5'
 
 from functools import wraps
 from django.shortcuts import redirect
+from djangoerp.core.decorators import get_cached_object
 
 from .models import Plugget
-import collections
 
 
 def is_plugget_editable(get_plugget_func, redirect_to='/'):
@@ -32,8 +32,8 @@ def is_plugget_editable(get_plugget_func, redirect_to='/'):
         def _wrapped_view(request, *args, **kwargs):
             from .loading import registry
             plugget = None
-            if isinstance(get_plugget_func, collections.Callable):
-                plugget = get_plugget_func(request, *args, **kwargs)
+            if callable(get_plugget_func):
+                plugget = get_cached_object(request, get_plugget_func, request, *args, **kwargs)
             if plugget\
             and (not isinstance(plugget, Plugget)\
                 or (plugget.source not in registry.get_plugget_sources())):
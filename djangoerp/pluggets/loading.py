@@ -15,7 +15,6 @@ __copyright__ = 'Copyright (c) 2013-2015, django ERP Team'
 __version__ = '0.0.5'
 
 
-import collections
 from djangoerp.core.singleton import Singleton
 
 
@@ -28,7 +27,7 @@ class PluggetSourceCache(metaclass=Singleton):
         self.clear()
         
     def register(self, func, title, description, template, form):        
-        if not isinstance(func, collections.Callable):
+        if not callable(func):
             func = self.default_func
             
         import inspect
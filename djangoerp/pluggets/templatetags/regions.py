@@ -18,13 +18,12 @@ __version__ = '0.0.5'
 import json
 from django.conf import settings
 from django import template
-from django.template import Engine
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.contenttypes.models import ContentType
+from djangoerp.core.cache import TemplateCache
 
 from ..loading import registry
 from ..models import Region, Plugget
-import collections
 
 
 register = template.Library()
@@ -69,12 +68,10 @@ def render_plugget(context, plugget_pk, template_name=None):
                     context = func(context)
                 except:
                     pass
-            if isinstance(func, collections.Callable):
+            if callable(func):
                 context = func(context)
 
-            html_template = Engine.get_default().get_template(
-                template_name or plugget.template
-            )
+            html_template = TemplateCache().get(template_name or plugget.template)
             with context.push(plugget=plugget):
                 result = html_template.render(context)
         except ObjectDoesNotExist:
@@ -104,9 +101,7 @@ def render_region(context, region_slug, template_name=None):
 
     try:
         region = Region.objects.get(slug=region_slug)
-        html_template = Engine.get_default().get_template(
-            template_name or settings.REGION_DEFAULT_TEMPLATE
-        )
+        html_template = TemplateCache().get(template_name or settings.REGION_DEFAULT_TEMPLATE)
         with context.push(region=region):
             result = html_template.render(context)
     except ObjectDoesNotExist:
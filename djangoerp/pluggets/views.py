@@ -21,6 +21,7 @@ import json
 
 from django.db.models import Model as DjangoModel
 from django.forms import Form as DjangoForm
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _
 from django.utils.decorators import method_decorator
@@ -29,7 +30,7 @@ from django.contrib import messages
 from django.contrib.messages.views import SuccessMessageMixin
 from formtools.wizard.views import SessionWizardView
 from djangoerp.core.views import SetCancelUrlMixin
-from djangoerp.core.decorators import obj_permission_required as permission_required
+from djangoerp.core.decorators import obj_permission_required as permission_required, get_cached_object, get_view_object
 
 from .loading import registry
 from .decorators import is_plugget_editable
@@ -51,7 +52,8 @@ def _get_plugget_add_or_edit_perm(*args, **kwargs):
     If a "pk" kwarg is present, we're checking for edit an existing plugget,
     otherwise we want to add a new one.
     """
-    plugget = _get_plugget(*args, **kwargs)
+    request = args[0] if args else None
+    plugget = get_cached_object(request, _get_plugget, *args, **kwargs)
     if plugget:
         return "pluggets.change_plugget"
     return "pluggets.add_plugget"
@@ -64,10 +66,13 @@ def _get_region(*args, **kwargs):
     
     If also this fails, it raises an exception.
     """
-    default = _get_plugget(*args, **kwargs)
-    if default:
-        default = default.region.slug
-    return Region.objects.get(slug=kwargs.get("slug", default))
+    slug = kwargs.get("slug", None)
+    if slug is None:
+        request = args[0] if args else None
+        plugget = get_cached_object(request, _get_plugget, *args, **kwargs)
+        if plugget:
+            return plugget.region
+    return Region.objects.get(slug=slug)
 
 class PluggetWizard(SetCancelUrlMixin, SessionWizardView):
     DEFAULT_FORMS = [SelectPluggetSourceForm, CustomizePluggetSettingsForm]
@@ -84,12 +89,18 @@ class PluggetWizard(SetCancelUrlMixin, SessionWizardView):
         return super(PluggetWizard, self).dispatch(request, *args, **kwargs)
         
     def get_form_kwargs(self, step):
+        # Reuses the objects already loaded by "obj_permission_required".
         if "pk" in self.kwargs:
-            self.instance = get_object_or_404(Plugget, pk=self.kwargs['pk'])
+            self.instance = get_view_object(self, _get_plugget)
+            if self.instance is None:
+                raise Http404
             self.region = self.instance.region
             
         elif "slug" in self.kwargs:
-            self.region = get_object_or_404(Region, slug=self.kwargs['slug'])
+            try:
+                self.region = get_view_object(self, _get_region)
+            except Region.DoesNotExist:
+                raise Http404
             
         if step == "1":
             return {"region": self.region}
@@ -223,7 +234,13 @@ class DeletePluggetView(SuccessMessageMixin, SetCancelUrlMixin, DeleteView):
         return super(DeletePluggetView, self).dispatch(request, *args, **kwargs)
         
     def get_object(self, queryset=None):
-        self.object = super(DeletePluggetView, self).get_object(queryset)
+        if queryset is None:
+            # Reuses the plugget already loaded by "obj_permission_required".
+            self.object = get_view_object(self, _get_plugget)
+            if self.object is None:
+                raise Http404
+        else:
+            self.object = super(DeletePluggetView, self).get_object(queryset)
         self.cancel_url = self.object.region.get_absolute_url()
         self.success_url = self.object.region.get_absolute_url()
         return self.object
@@ -0,0 +1,79 @@
+/*
+ * This file is part of the django ERP project.
+ *
+ * Suggests the values of the "input.autocomplete" filters of model lists.
+ *
+ * Each input asks its "data-autocomplete-url" for the objects matching the
+ * typed term (sent as "data-autocomplete-term" parameter) and lists them in
+ * a datalist: choosing a suggestion fills the input with the object's key.
+ */
+(function () {
+    "use strict";
+
+    var DELAY = 300;
+
+    function bind(input, index) {
+        var datalist = document.createElement("datalist"),
+            timer = null,
+            last = null;
+
+        datalist.id = "autocomplete-" + index;
+        input.parentNode.appendChild(datalist);
+        input.setAttribute("list", datalist.id);
+        input.setAttribute("autocomplete", "off");
+
+        function update(items) {
+            while (datalist.firstChild) {
+                datalist.removeChild(datalist.firstChild);
+            }
+            items.forEach(function (item) {
+                var option = document.createElement("option");
+                option.value = item.value;
+                option.label = item.label;
+                option.textContent = item.label;
+                datalist.appendChild(option);
+            });
+        }
+
+        function search() {
+            var term = input.value.trim(),
+                url = input.getAttribute("data-autocomplete-url");
+
+            if (!term || term === last) {
+                return;
+            }
+            last = term;
+            url += (url.indexOf("?") < 0 ? "?" : "&")
+                + encodeURIComponent(input.getAttribute("data-autocomplete-term"))
+                + "=" + encodeURIComponent(term);
+
+            var request = new XMLHttpRequest();
+            request.open("GET", url);
+            request.setRequestHeader("X-Requested-With", "XMLHttpRequest");
+            request.onload = function () {
+                if (request.status === 200 && input.value.trim() === term) {
+                    update(JSON.parse(request.responseText));
+                }
+            };
+            request.send();
+        }
+
+        input.addEventListener("input", function () {
+            clearTimeout(timer);
+            timer = setTimeout(search, DELAY);
+        });
+    }
+
+    function init() {
+        var inputs = document.querySelectorAll("input.autocomplete[data-autocomplete-url]");
+        for (var i = 0; i < inputs.length; i++) {
+            bind(inputs[i], i);
+        }
+    }
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", init);
+    } else {
+        init();
+    }
+})();